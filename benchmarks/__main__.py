@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+
+from ffxiv_tools.utils import print_table
+
+from . import fixture
+from .cases import CASES
+from .runner import run, compare
+
+def format_value(metric, value):
+    if metric in ("p50", "p90", "p99", "max"):
+        return "{:.3f}ms".format(value * 1000)
+    return "{:.1f}".format(value)
+
+def run_benchmarks(args):
+    path = fixture.build(args.fixture)
+    report = run(path, args.cases, args.repeat)
+
+    if args.o:
+        with open(args.o, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    print_table(
+        ["CASE", "OPS", "P50", "P90", "P99", "THROUGHPUT", "PEAK_MEMORY"],
+        [
+            [
+                name, case["operations"],
+                format_value("p50", case["p50"]), format_value("p90", case["p90"]), format_value("p99", case["p99"]),
+                "{0:.1f} {1}/s".format(case["throughput"], case["unit"]), case["peak_memory"]
+            ] for name, case in report["cases"].items()
+        ]
+    )
+
+def compare_runs(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows = compare(old, new, args.threshold)
+    print_table(
+        ["CASE", "METRIC", "OLD", "NEW", "RATIO", ""],
+        [
+            [name, metric, format_value(metric, old_value), format_value(metric, new_value), "{:.2f}".format(ratio), "REGRESSION" if regressed else ""]
+            for name, metric, old_value, new_value, ratio, regressed in rows
+        ]
+    )
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="ffxiv_tools read pipeline benchmarks")
+    subparsers = parser.add_subparsers(title="commands")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks on a synthetic sqpack")
+    run_parser.add_argument("--fixture", default=os.path.join("build", "bench_sqpack"), help="where the synthetic sqpack is written, reused if already there")
+    run_parser.add_argument("--repeat", type=int, help="passes over the operations of every case, each case has its own default")
+    run_parser.add_argument("--cases", nargs="+", choices=list(CASES), help="only run these cases")
+    run_parser.add_argument("-o", required=False, help="json report, printed on stdout by default")
+    run_parser.set_defaults(callback=run_benchmarks)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two json reports, exits with 1 on regressions")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged as a regression")
+    compare_parser.set_defaults(callback=compare_runs)
+
+    args = parser.parse_args()
+    if not hasattr(args, "callback"):
+        parser.print_help()
+        return
+    args.callback(args)
+
+if __name__ == "__main__":
+    main()
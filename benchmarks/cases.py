@@ -0,0 +1,99 @@
+import subprocess
+import sys
+
+import binr
+
+from ffxiv_tools.archfs import FileSystem
+from ffxiv_tools.fsmdl import Model
+from ffxiv_tools.mdl import mdl_to_dict
+from ffxiv_tools.fmt.exh import exh
+from ffxiv_tools.fmt.exd import exd_row_layout, exd_rows
+from ffxiv_tools.fmt.vertex_buffer import vertex_buffer
+
+from . import fixture
+
+# A case is a generator of operations: the setup of an operation runs when it
+# is generated, only the call is timed. An operation returns how many units
+# (bytes or items) it processed.
+
+def index_load(path, repeat):
+    for _ in range(repeat):
+        folders = list(FileSystem(path).folders())
+        def op(folders=folders):
+            return sum(len(folder) for folder in folders)
+        yield op
+
+def header_scan(path, repeat):
+    for _ in range(repeat):
+        folder = FileSystem(path).folder("chara")
+        len(folder) # index loaded outside of the timing
+        def op(folder=folder):
+            folder.scan_headers()
+            return len(folder)
+        yield op
+
+def get_entries(paths):
+    def case(path, repeat):
+        file_system = FileSystem(path)
+        file_refs = [file_system.file(file_path) for file_path in paths]
+        for _ in range(repeat):
+            for file_ref in file_refs:
+                def op(file_ref=file_ref):
+                    file_ref.get()
+                    return file_ref.size()
+                yield op
+    return case
+
+def exd_decode(path, repeat):
+    file_system = FileSystem(path)
+    header = binr.read(exh, file_system.file("exd/{}.exh".format(fixture.EXD_TABLE)).get().data())
+    pages = [bytes(file_system.file(fixture.exd_path(page)).get().data()) for page in range(fixture.EXD_PAGES)]
+    for _ in range(repeat):
+        layout = exd_row_layout(header.header.data_offset, header.members)
+        for page in pages:
+            def op(page=page, layout=layout):
+                exd_rows(page, layout)
+                return len(page)
+            yield op
+
+def model_meshes(path):
+    model = Model(FileSystem(path).file(fixture.mdl_path(0)).get())
+    return [mesh for lod in model.lods() for mesh in lod.meshes()]
+
+def vertex_decode(path, repeat):
+    meshes = model_meshes(path)
+    for _ in range(repeat):
+        for mesh in meshes:
+            def op(mesh=mesh):
+                return len(binr.read(vertex_buffer, mesh.vertex_buffer, mesh.header, mesh.shape))
+            yield op
+
+def mdl_serialize(path, repeat):
+    mdl_file = FileSystem(path).file(fixture.mdl_path(0)).get()
+    for _ in range(repeat):
+        model = Model(mdl_file)
+        def op(model=model):
+            mdl_to_dict(model)
+            return 1
+        yield op
+
+def cli_import(path, repeat):
+    # Startup cost of the command line, in a fresh interpreter every time
+    for _ in range(repeat):
+        def op():
+            subprocess.run([sys.executable, "-c", "import ffxiv_tools.cli"], check=True)
+            return 1
+        yield op
+
+# name: (case, unit, repeat)
+CASES = {
+    "index_load"    : (index_load, "items", 20),
+    "header_scan"   : (header_scan, "items", 20),
+    "get_std"       : (get_entries([fixture.std_path(i) for i in range(fixture.STD_COUNT)]), "bytes", 4),
+    "get_mdl"       : (get_entries([fixture.mdl_path(i) for i in range(fixture.MDL_COUNT)]), "bytes", 8),
+    "get_tex"       : (get_entries([fixture.tex_path(i) for i in range(fixture.TEX_COUNT)]), "bytes", 8),
+    "exd_decode"    : (exd_decode, "bytes", 4),
+    "vertex_decode" : (vertex_decode, "items", 2),
+    "mdl_to_dict"   : (mdl_serialize, "items", 4),
+    "cli_import"    : (cli_import, "items", 10)
+}
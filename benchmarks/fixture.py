@@ -0,0 +1,177 @@
+from random import Random
+import os
+import struct
+
+from ffxiv_tools.archwriter import FolderWriter
+from ffxiv_tools.fmt.mdl_meshes_shape import MDL_MESH_SHAPE_SIZE
+
+# A small but well formed install: an exd folder with one table and a chara
+# folder with std, mdl and tex entries. Everything comes from a seeded Random
+# so that two runs benchmark the same bytes.
+
+EXD_TABLE = "bench"
+EXD_PAGES = 4
+EXD_PAGE_ROWS = 500
+
+STD_COUNT = 256
+MDL_COUNT = 16
+MDL_MESH_COUNT = 4
+MDL_MESH_VERTICES = 2000
+TEX_COUNT = 16
+TEX_SIZE = 256
+
+# Bytes drawn from 16 values, which deflate to about half their size
+NIBBLES = bytes(i & 0x0F for i in range(0x100))
+
+def payload(rnd, size):
+    return rnd.randbytes(size).translate(NIBBLES)
+
+def std_path(i):
+    return "chara/bench/std/{:04}.bin".format(i)
+
+def mdl_path(i):
+    return "chara/bench/model/{:04}.mdl".format(i)
+
+def tex_path(i):
+    return "chara/bench/texture/{:04}.tex".format(i)
+
+def exd_path(page):
+    return "exd/{0}_{1}.exd".format(EXD_TABLE, page * EXD_PAGE_ROWS)
+
+################################################################################
+# exd
+################################################################################
+
+# (member type, offset): a string, an uint32, an int16, a float32 and a bool
+EXD_MEMBERS = [(0x00, 0x00), (0x07, 0x04), (0x04, 0x08), (0x09, 0x0C), (0x01, 0x10)]
+EXD_DATA_SIZE = 0x14
+
+def exl():
+    return bytes("EXLT,2\r\n{},0\r\n".format(EXD_TABLE), "utf-8")
+
+def exh():
+    data = struct.pack(">4sHHHHH", b"EXHF", 3, EXD_DATA_SIZE, len(EXD_MEMBERS), EXD_PAGES, 1)
+    data += b"\x00" * (0x20 - len(data))
+    data += b"".join(struct.pack(">HH", member_type, offset) for member_type, offset in EXD_MEMBERS)
+    data += b"".join(struct.pack(">II", page * EXD_PAGE_ROWS, EXD_PAGE_ROWS) for page in range(EXD_PAGES))
+    return data + struct.pack("<H", 0) # no language
+
+def exd(rnd, page):
+    rows = []
+    for row_id in range(page * EXD_PAGE_ROWS, (page + 1) * EXD_PAGE_ROWS):
+        string = bytes("row {0} {1:x}".format(row_id, rnd.getrandbits(64)), "ascii") + b"\x00"
+        values = struct.pack(">IIh2xfB3x", 0, rnd.getrandbits(32), rnd.randint(-0x8000, 0x7FFF), rnd.random(), rnd.getrandbits(1))
+        row = values + string
+        rows.append((row_id, struct.pack(">IH", len(row), 1) + row))
+
+    headers_size = len(rows) * 0x08
+    offset = 0x20 + headers_size
+    headers = []
+    for row_id, row in rows:
+        headers.append(struct.pack(">II", row_id, offset))
+        offset += len(row)
+    header = struct.pack(">4sHHI", b"EXDF", 2, 0, headers_size) + b"\x00" * 0x14
+    return header + b"".join(headers) + b"".join(row for _, row in rows)
+
+################################################################################
+# mdl
+################################################################################
+
+# stream 0: position, blend weights and indices, stream 1: normal, uv,
+# color and binormal
+MDL_ELEMENTS = [
+    (0, 0x00, 0x02, 0x00),
+    (0, 0x0C, 0x08, 0x01),
+    (0, 0x10, 0x05, 0x02),
+    (1, 0x00, 0x0E, 0x03),
+    (1, 0x08, 0x0E, 0x04),
+    (1, 0x10, 0x08, 0x07),
+    (1, 0x14, 0x08, 0x06)
+]
+MDL_STRIDES = (0x14, 0x18)
+
+def mdl_meshes_shape():
+    shape = b"".join(struct.pack("<BBBBI", *element, 0) for element in MDL_ELEMENTS) + struct.pack("<BBBBI", 0xFF, 0, 0, 0, 0)
+    return (shape + b"\x00" * (MDL_MESH_SHAPE_SIZE - len(shape))) * MDL_MESH_COUNT
+
+def mdl_header(vertex_buffer_size, index_buffer_size):
+    strings = b"bench/material.mtrl\x00"
+    head = struct.pack("<f9HBBHBBfIHHBB7H", 0, MDL_MESH_COUNT, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    lods = struct.pack("<HHffHHHHHHHHIIIIIIII", 0, MDL_MESH_COUNT, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, vertex_buffer_size, index_buffer_size, 0, 0)
+    lods += struct.pack("<HHffHHHHHHHHIIIIIIII", *([0] * 20)) * 2
+
+    meshes = []
+    vertex_offset = 0
+    for i in range(MDL_MESH_COUNT):
+        meshes.append(struct.pack(
+            "<IIHHHHIIIIBBH",
+            MDL_MESH_VERTICES, MDL_MESH_VERTICES, 0, 0, 0, 0, i * MDL_MESH_VERTICES,
+            vertex_offset, vertex_offset + MDL_MESH_VERTICES * MDL_STRIDES[0], 0, MDL_STRIDES[0], MDL_STRIDES[1], 0
+        ))
+        vertex_offset += MDL_MESH_VERTICES * sum(MDL_STRIDES)
+
+    return (
+        struct.pack("<II", 1, len(strings)) + strings +
+        head + lods + b"".join(meshes) +
+        struct.pack("<I", 0) + # material name offset
+        struct.pack("<IB", 0, 0) + # bone indexes, offset to the bounding boxes
+        b"\x00" * 0x20 * 4
+    )
+
+def mdl_sections(rnd):
+    vertex_buffer = rnd.randbytes(MDL_MESH_COUNT * MDL_MESH_VERTICES * sum(MDL_STRIDES))
+    index_buffer = struct.pack("<{}H".format(MDL_MESH_COUNT * MDL_MESH_VERTICES), *(rnd.randrange(MDL_MESH_VERTICES) for _ in range(MDL_MESH_COUNT * MDL_MESH_VERTICES)))
+    # meshes shape, header, then the vertex, edge geometry and index buffers
+    # of the 3 lods, only the first lod is filled
+    return [
+        mdl_meshes_shape(), mdl_header(len(vertex_buffer), len(index_buffer)),
+        vertex_buffer, b"", b"",
+        b"", b"", b"",
+        index_buffer, b"", b""
+    ]
+
+################################################################################
+# tex
+################################################################################
+
+def tex(rnd):
+    mipmaps = []
+    size = TEX_SIZE
+    while size >= 4:
+        mipmaps.append(payload(rnd, size * size // 2)) # DXT1
+        size //= 2
+
+    header = bytearray(0x50)
+    struct.pack_into("<IHHHHB", header, 0, 0, 0x3420, 0, TEX_SIZE, TEX_SIZE, 1)
+    header[0x0E] = len(mipmaps)
+    offset = len(header)
+    for i, mipmap in enumerate(mipmaps):
+        struct.pack_into("<I", header, 0x1C + i * 4, offset)
+        offset += len(mipmap)
+    return bytes(header), mipmaps
+
+################################################################################
+# build
+################################################################################
+
+def build(path, seed=0):
+    # Returns path, the fixture is only written once. The chara folder is
+    # written last, its index tells that a previous build went through.
+    if os.path.exists(os.path.join(path, "040000.win32.index")):
+        return path
+
+    rnd = Random(seed)
+    with FolderWriter(path, "exd") as writer:
+        writer.add_std("exd/root.exl", exl())
+        writer.add_std("exd/{}.exh".format(EXD_TABLE), exh())
+        for page in range(EXD_PAGES):
+            writer.add_std(exd_path(page), exd(rnd, page))
+
+    with FolderWriter(path, "chara") as writer:
+        for i in range(STD_COUNT):
+            writer.add_std(std_path(i), payload(rnd, rnd.randrange(0x100, 0x10000)))
+        for i in range(MDL_COUNT):
+            writer.add_mdl(mdl_path(i), mdl_sections(rnd))
+        for i in range(TEX_COUNT):
+            writer.add_tex(tex_path(i), *tex(rnd))
+    return path
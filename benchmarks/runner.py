@@ -0,0 +1,78 @@
+import gc
+import platform
+from time import perf_counter
+import tracemalloc
+
+from .cases import CASES
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * p // 100)]
+
+def run_case(path, name, repeat=None):
+    case, unit, default_repeat = CASES[name]
+    repeat = repeat or default_repeat
+
+    latencies = []
+    units = 0
+    gc.collect()
+    for op in case(path, repeat):
+        start = perf_counter()
+        units += op()
+        latencies.append(perf_counter() - start)
+    latencies.sort()
+    elapsed = sum(latencies)
+
+    # Measured apart, tracing allocations slows every call down
+    peak_memory = 0
+    for op in case(path, 1):
+        gc.collect()
+        tracemalloc.start()
+        op()
+        peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    rv = {
+        "unit": unit,
+        "operations": len(latencies),
+        "units": units,
+        "seconds": elapsed,
+        "throughput": units / elapsed if elapsed else 0,
+        "peak_memory": peak_memory
+    }
+    for p in PERCENTILES:
+        rv["p{}".format(p)] = percentile(latencies, p)
+    rv["max"] = latencies[-1]
+    return rv
+
+def run(path, names=None, repeat=None):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": {
+            name: run_case(path, name, repeat) for name in (names or CASES)
+        }
+    }
+
+# Tail latencies of a short run are too noisy to gate on
+COMPARED_METRICS = ("p50", "throughput", "peak_memory")
+
+def compare(old, new, threshold=0.1):
+    # (name, metric, old value, new value, ratio, regressed) of every case
+    # present in both runs. Median latency and peak memory regress when they
+    # grow by more than threshold, throughput when it drops by more than it.
+    rv = []
+    for name, new_case in new["cases"].items():
+        old_case = old["cases"].get(name)
+        if old_case is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old_value, new_value = old_case[metric], new_case[metric]
+            ratio = new_value / old_value if old_value else 1.0
+            if metric == "throughput":
+                regressed = ratio < 1 - threshold
+            else:
+                regressed = ratio > 1 + threshold
+            rv.append((name, metric, old_value, new_value, ratio, regressed))
+    return rv
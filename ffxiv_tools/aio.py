@@ -0,0 +1,146 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from .rsc import resource_id_from_filepath
+
+logger = logging.getLogger(__name__)
+
+def resource_key(resource_id):
+    return (resource_id.folder_name, resource_id.dirname_hash, resource_id.filename_hash)
+
+class Executor:
+    # Runs the blocking calls of the library on a bounded thread pool, calls
+    # made with the same key while one is running share its result. Wrappers
+    # share an executor, so their keys start with the object they wrap.
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers)
+        self._pending = {}
+        logger.info("%s", self)
+
+    def _done(self, key, entry, future):
+        if self._pending.get(key) is entry:
+            del self._pending[key]
+
+    async def run(self, key, func, *args):
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = [asyncio.get_running_loop().run_in_executor(self._pool, func, *args), 0]
+            entry[0].add_done_callback(lambda future, entry=entry: self._done(key, entry, future))
+            self._pending[key] = entry
+
+        entry[1] += 1
+        try:
+            # Shielded so that one cancelled caller does not cancel the others
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # Nobody waits for it anymore, dropped if it did not start yet.
+                # Forgotten right away so that a later caller starts a new one.
+                if self._pending.get(key) is entry:
+                    del self._pending[key]
+                entry[0].cancel()
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __str__(self):
+        return "<aio.Executor(max_workers={self.max_workers})>".format(self=self)
+
+class FileSystem:
+    def __init__(self, fs, executor):
+        self.fs = fs
+        self.executor = executor
+        logger.info("%s", self)
+
+    async def file(self, filepath):
+        return await self.file_by_id(resource_id_from_filepath(filepath))
+
+    async def file_by_id(self, resource_id):
+        return FileRef(
+            await self.executor.run((self.fs, "file_by_id", resource_key(resource_id)), self.fs.file_by_id, resource_id),
+            self.executor,
+            self.fs
+        )
+
+    def __str__(self):
+        return "<aio.FileSystem(fs={self.fs}, executor={self.executor})>".format(self=self)
+
+class FileRef:
+    def __init__(self, file_ref, executor, fs):
+        self.file_ref = file_ref
+        self.executor = executor
+        self.fs = fs
+
+    def resource_id(self):
+        return self.file_ref.resource_id()
+
+    async def type(self):
+        return await self.executor.run((self.fs, "type", resource_key(self.resource_id())), self.file_ref.type)
+
+    async def get(self):
+        return await self.executor.run((self.fs, "get", resource_key(self.resource_id())), self.file_ref.get)
+
+    def __str__(self):
+        return "<aio.FileRef(file_ref={self.file_ref})>".format(self=self)
+
+class ResourceManager:
+    def __init__(self, rsc, executor):
+        self.rsc = rsc
+        self.executor = executor
+        logger.info("%s", self)
+
+    async def get_model(self, filepath):
+        return await self.get_model_by_id(resource_id_from_filepath(filepath))
+
+    async def get_texture(self, filepath):
+        return await self.get_texture_by_id(resource_id_from_filepath(filepath))
+
+    async def get_material(self, filepath):
+        return await self.get_material_by_id(resource_id_from_filepath(filepath))
+
+    async def get_model_by_id(self, resource_id):
+        return await self.executor.run((self.rsc, "model", resource_key(resource_id)), self.rsc.get_model_by_id, resource_id)
+
+    async def get_texture_by_id(self, resource_id):
+        return await self.executor.run((self.rsc, "texture", resource_key(resource_id)), self.rsc.get_texture_by_id, resource_id)
+
+    async def get_material_by_id(self, resource_id):
+        return await self.executor.run((self.rsc, "material", resource_key(resource_id)), self.rsc.get_material_by_id, resource_id)
+
+    def __str__(self):
+        return "<aio.ResourceManager(rsc={self.rsc}, executor={self.executor})>".format(self=self)
+
+class DataTables:
+    def __init__(self, dt, executor):
+        self.dt = dt
+        self.executor = executor
+        logger.info("%s", self)
+
+    async def loc_table(self, table_name, lang=""):
+        return LocTable(
+            await self.executor.run((self.dt, "loc_table", table_name, lang), lambda: self.dt.table(table_name).loc_table(lang)),
+            self.executor
+        )
+
+    def __str__(self):
+        return "<aio.DataTables(dt={self.dt}, executor={self.executor})>".format(self=self)
+
+class LocTable:
+    def __init__(self, loc_table, executor):
+        self.loc_table = loc_table
+        self.executor = executor
+
+    def name(self):
+        return self.loc_table.name()
+
+    def lang(self):
+        return self.loc_table.lang()
+
+    async def row(self, id):
+        return await self.executor.run((self.loc_table, "row", id), self.loc_table.row, id)
+
+    def __str__(self):
+        return "<aio.LocTable(loc_table={self.loc_table})>".format(self=self)
@@ -1,13 +1,23 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
 import logging
+import os
 from pathlib import Path
 
 import binr
 
 from . import fs
-from .rsc import ResourceId
-from .utils import lazy_attribute, mmap_reader
-from .fmt.index import index
-from .fmt.dat import file, file_header, file_with_header
+from . import stats
+from .rsc import ResourceId, PathResourceId, path_hash
+from .snapshot import SnapshotStore
+from .pathdb import PathDatabase
+from .utils import lazy_attribute, mmap_reader, MmapPool, ByteLRUCache, nt
+from .fmt.index import index_table, sorted_index_table, index2_table, sorted_index2_table, dat_nb, dat_offset
+from .fmt.dat import file_header, file_layout, read_file, read_std_range, decompress_std_block, scan_file_headers
+
+logger = logging.getLogger(__name__)
 
 class FileSystem(fs.FileSystem):
     DAT_ID_TO_NAME = {
@@ -28,9 +38,15 @@ class FileSystem(fs.FileSystem):
         "13": "_debug"
     }
 
-    def __init__(self, base_path):
+    def __init__(self, base_path, snapshot_path=None, max_open_dats=16, decode_threads=0, cache_size=0, path_db=None):
         self.base_path = base_path
-        logging.info(self)
+        self.paths = PathDatabase(path_db) if path_db else None
+        self.snapshots = SnapshotStore(snapshot_path) if snapshot_path else None
+        self.mmaps = MmapPool(max_open_dats)
+        # Shared by every read, blocks of large files are decompressed concurrently
+        self.executor = ThreadPoolExecutor(decode_threads) if decode_threads else None
+        self.cache = ByteLRUCache(cache_size) if cache_size else None
+        logger.info("%s", self)
 
     @lazy_attribute
     def _folders(self):
@@ -42,6 +58,7 @@ class FileSystem(fs.FileSystem):
             rv[name] = Folder(
                 name = name,
                 base_path = "{0}/{1}0000.win32".format(self.base_path, dat_id),
+                fs = self
             )
         return rv
 
@@ -51,48 +68,223 @@ class FileSystem(fs.FileSystem):
     def folder(self, folder_name):
         return self._folders[folder_name]
 
+    def file(self, filepath):
+        return self.folder(filepath.split("/", 1)[0].lower()).file_by_path(filepath)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.mmaps.close()
+
     def __str__(self):
-        return "<archfs.FileSystem(base_path={self.base_path})>".format(self=self)
+        return "<archfs.FileSystem(base_path={self.base_path}, snapshots={self.snapshots}, cache={self.cache})>".format(self=self)
 
 class Folder(fs.Folder):
-    def __init__(self, name, base_path):
+    def __init__(self, name, base_path, fs):
         self._name = name
         self.base_path = base_path
-        logging.info(self)
+        self.fs = fs
+        logger.info("%s", self)
 
     def name(self):
         return self._name
 
+    def index_path(self):
+        return "{0}.index".format(self.base_path)
+
+    def index2_path(self):
+        return "{0}.index2".format(self.base_path)
+
+    def dat_path(self, dat_nb):
+        return "{0}.dat{1}".format(self.base_path, dat_nb)
+
     @lazy_attribute
-    def _files(self):
-        rv = {}
-        file_entries = None
-        with mmap_reader("{0}.index".format(self.base_path)) as r:
-            rv = {
-                (file_entry.dirname_hash, file_entry.filename_hash): FileRef(
-                    dat_path = "{0}.dat{1}".format(self.base_path, file_entry.dat_nb),
-                    offset = file_entry.offset,
-                    resource_id = ResourceId(
-                        folder_name = self._name,
-                        dirname_hash = file_entry.dirname_hash,
-                        filename_hash = file_entry.filename_hash
-                    )
-                ) for file_entry in binr.read(index, r)
-            }
-        return rv
+    def _index(self):
+        with stats.timed("archfs.index_load"):
+            snapshots = self.fs.snapshots
+            rv = snapshots.load(self.index_path()) if snapshots else None
+            if rv is None:
+                with mmap_reader(self.index_path()) as r:
+                    rv = sorted_index_table(index_table(r))
+                if snapshots:
+                    snapshots.save(self.index_path(), rv)
+            return rv
+
+    @lazy_attribute
+    def _index2(self):
+        if not os.path.exists(self.index2_path()):
+            return None
+        with stats.timed("archfs.index_load"):
+            snapshots = self.fs.snapshots
+            rv = snapshots.load(self.index2_path()) if snapshots else None
+            if rv is None:
+                with mmap_reader(self.index2_path()) as r:
+                    rv = sorted_index2_table(index2_table(r))
+                if snapshots:
+                    snapshots.save(self.index2_path(), rv)
+            return rv
+
+    def _add_columns(self, columns):
+        # Derived columns are kept with the index, and in its snapshot so
+        # they are only computed once per game version
+        self._index.update(columns)
+        if self.fs.snapshots:
+            self.fs.snapshots.save(self.index_path(), self._index)
+
+    @lazy_attribute
+    def _filename_index(self):
+        if not "filename_order" in self._index:
+            filename_hashes = self._index["filename_hashes"]
+            order = array("I", sorted(range(len(self)), key=filename_hashes.__getitem__))
+            self._add_columns({
+                "filename_order": order,
+                "filename_sorted": array("I", map(filename_hashes.__getitem__, order))
+            })
+        return self._index["filename_sorted"], self._index["filename_order"]
+
+    def scan_headers(self):
+        # Reads the header of every entry in dat then offset order, one
+        # mapping per dat, instead of one random read per FileRef
+        if "entry_types" in self._index:
+            return
+        with stats.timed("archfs.header_scan"):
+            dat_offset_nbs = self._index["dat_offset_nbs"]
+            header_sizes = array("I", bytes(4 * len(self)))
+            entry_types = array("B", bytes(len(self)))
+            file_sizes = array("I", bytes(4 * len(self)))
+            stored_sizes = array("I", bytes(4 * len(self)))
+
+            order = sorted(range(len(self)), key=lambda i: (dat_nb(dat_offset_nbs[i]), dat_offset(dat_offset_nbs[i])))
+            for nb, positions in groupby(order, key=lambda i: dat_nb(dat_offset_nbs[i])):
+                positions = list(positions)
+                with self.fs.mmaps.reader(self.dat_path(nb)) as r:
+                    headers = scan_file_headers(r, [dat_offset(dat_offset_nbs[i]) for i in positions])
+                for i, (header_size, entry_type, uncompressed_size, stored_size) in zip(positions, headers):
+                    header_sizes[i] = header_size
+                    entry_types[i] = entry_type
+                    file_sizes[i] = uncompressed_size
+                    stored_sizes[i] = stored_size
+
+            self._add_columns({
+                "header_sizes": header_sizes,
+                "entry_types": entry_types,
+                "file_sizes": file_sizes,
+                "stored_sizes": stored_sizes
+            })
+
+    def __len__(self):
+        return len(self._index["dat_offset_nbs"])
+
+    def _dir_range(self, dirname_hash):
+        dirname_hashes = self._index["dirname_hashes"]
+        lo = bisect_left(dirname_hashes, dirname_hash)
+        return lo, bisect_right(dirname_hashes, dirname_hash, lo)
+
+    def _position(self, dirname_hash, filename_hash):
+        lo, hi = self._dir_range(dirname_hash)
+        filename_hashes = self._index["filename_hashes"]
+        i = bisect_left(filename_hashes, filename_hash, lo, hi)
+        if i == hi or filename_hashes[i] != filename_hash:
+            raise KeyError((dirname_hash, filename_hash))
+        return i
+
+    def has_file(self, dirname_hash, filename_hash):
+        try:
+            self._position(dirname_hash, filename_hash)
+            return True
+        except KeyError:
+            return False
+
+    def _file_ref(self, i, path=None):
+        dat_offset_nb = self._index["dat_offset_nbs"][i]
+        dirname_hash = self._index["dirname_hashes"][i]
+        filename_hash = self._index["filename_hashes"][i]
+        if path is None and self.fs.paths is not None:
+            path = self.fs.paths.find(dirname_hash, filename_hash)
+        header = None
+        stored_size = None
+        if "entry_types" in self._index:
+            header = nt("FileHeader",
+                ("size"              , self._index["header_sizes"][i]),
+                ("entry_type"        , self._index["entry_types"][i]),
+                ("uncompressed_size" , self._index["file_sizes"][i])
+            )
+            stored_size = self._index["stored_sizes"][i]
+        return FileRef(
+            dat_path = self.dat_path(dat_nb(dat_offset_nb)),
+            offset = dat_offset(dat_offset_nb),
+            fs = self.fs,
+            header = header,
+            stored_size = stored_size,
+            resource_id = ResourceId(
+                folder_name = self._name,
+                dirname_hash = dirname_hash,
+                filename_hash = filename_hash,
+                path = path
+            )
+        )
 
     def files(self):
-        return self._files.values()
+        for i in range(len(self)):
+            yield self._file_ref(i)
+
+    def files_in_dir(self, dirname_hash):
+        for i in range(*self._dir_range(dirname_hash)):
+            yield self._file_ref(i)
+
+    def files_named(self, filename_hash):
+        filename_sorted, filename_order = self._filename_index
+        lo = bisect_left(filename_sorted, filename_hash)
+        for i in range(lo, bisect_right(filename_sorted, filename_hash, lo)):
+            yield self._file_ref(filename_order[i])
 
     def file(self, resource_id):
-        rv = self._files[(resource_id.dirname_hash, resource_id.filename_hash)]
         # Appending path as we are discovering them
-        rv.resource_id().path = rv.resource_id().path if resource_id.path is None else resource_id.path
-        return rv
+        return self._file_ref(self._position(resource_id.dirname_hash, resource_id.filename_hash), resource_id.path)
+
+    def file_by_path(self, filepath):
+        # One hash of the full path against index2, the split hashes of the
+        # main index are only used when index2 is missing or ambiguous
+        if self._index2 is not None:
+            path_hashes = self._index2["path_hashes"]
+            h = path_hash(filepath.lower())
+            i = bisect_left(path_hashes, h)
+            if i < len(path_hashes) and path_hashes[i] == h and (i + 1 == len(path_hashes) or path_hashes[i + 1] != h):
+                dat_offset_nb = self._index2["dat_offset_nbs"][i]
+                if not dat_offset_nb & 0x01: # hash collision flag
+                    return FileRef(
+                        resource_id = PathResourceId(self._name, filepath),
+                        dat_path = self.dat_path(dat_nb(dat_offset_nb)),
+                        offset = dat_offset(dat_offset_nb),
+                        fs = self.fs
+                    )
+        return super().file_by_path(filepath)
 
     def __str__(self):
         return "<archfs.Folder(name={self._name}, base_path={self.base_path})>".format(self=self)
 
+def readonly(view):
+    # Raw tex headers are bytes, already read only
+    return view.toreadonly() if isinstance(view, memoryview) else view
+
+def readonly_file(file_value):
+    # Cached entries are shared by every caller, who only get read only views
+    value = file_value.value
+    if file_value.header.entry_type == 0x02:
+        value = readonly(value)
+    elif file_value.header.entry_type == 0x03:
+        value = value._replace(
+            header = readonly(value.header),
+            meshes_shape = readonly(value.meshes_shape),
+            lods_buffers = [[readonly(buffer) for buffer in lod_buffers] for lod_buffers in value.lods_buffers]
+        )
+    elif file_value.header.entry_type == 0x04:
+        value = value._replace(
+            header = readonly(value.header),
+            mipmaps = [readonly(mipmap) for mipmap in value.mipmaps]
+        )
+    return file_value._replace(value=value)
+
 class FileRef(fs.FileRef):
     ENTRY_TYPE_TO_FILE_TYPE = {
         0x01: fs.FileType.NON,
@@ -101,27 +293,72 @@ class FileRef(fs.FileRef):
         0x04: fs.FileType.TEX
     }
 
-    def __init__(self, resource_id, dat_path, offset):
+    def __init__(self, resource_id, dat_path, offset, fs, header=None, stored_size=None):
         self._resource_id = resource_id
         self.dat_path = dat_path
         self.offset = offset
-        logging.info(self)
+        self.fs = fs
+        if header is not None:
+            # Already known from a header scan
+            self._header = header
+        self._stored_size = stored_size
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self._resource_id
 
     @lazy_attribute
     def _header(self):
-        with mmap_reader(self.dat_path) as r:
+        with self.fs.mmaps.reader(self.dat_path) as r:
             return binr.read(file_header, r, self.offset)
 
     def type(self):
         return self.ENTRY_TYPE_TO_FILE_TYPE[self._header.entry_type]
 
+    def size(self):
+        return self._header.uncompressed_size
+
+    def stored_size(self):
+        # Header and compressed blocks, only known once the headers of the
+        # folder are scanned, None before that
+        return self._stored_size
+
+    def _cached(self):
+        if self.fs.cache is None:
+            return None
+        rv = self.fs.cache.get((self.dat_path, self.offset))
+        stats.add("archfs.cache_misses" if rv is None else "archfs.cache_hits")
+        return rv
+
+    def read(self, offset=0, length=None):
+        if self.type() != fs.FileType.STD:
+            return super().read(offset, length)
+        fs.check_range(offset, length)
+        file_value = self._cached()
+        if file_value is not None:
+            return file_value.value[offset:] if length is None else file_value.value[offset:offset + length]
+        with self.fs.mmaps.reader(self.dat_path) as r:
+            return read_std_range(r, self.offset, self._header, offset, length)
+
+    def iter_chunks(self):
+        if self.type() != fs.FileType.STD:
+            yield from super().iter_chunks()
+            return
+        with self.fs.mmaps.reader(self.dat_path) as r:
+            block_offsets = binr.read(file_layout, r, self._header, self.offset).block_offsets
+        for block_offset in block_offsets:
+            with self.fs.mmaps.reader(self.dat_path) as r:
+                chunk = decompress_std_block(r, block_offset)
+            yield chunk
+
     def get(self):
-        file_value = None
-        with mmap_reader(self.dat_path) as r:
-            file_value = binr.read(file_with_header, r, self._header, self.offset)
+        file_value = self._cached()
+        if file_value is None:
+            with self.fs.mmaps.reader(self.dat_path) as r:
+                file_value = read_file(r, self.offset, self._header, self.fs.executor)
+            if self.fs.cache is not None:
+                file_value = readonly_file(file_value)
+                self.fs.cache.put((self.dat_path, self.offset), file_value, self._header.uncompressed_size)
         file_type = self.type()
 
         if file_type == fs.FileType.STD:
@@ -141,7 +378,7 @@ class FileRef(fs.FileRef):
 class NonFile(fs.NonFile):
     def __init__(self, resource_id):
         self._resource_id = resource_id
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self._resource_id
@@ -153,7 +390,7 @@ class StdFile(fs.StdFile):
     def __init__(self, resource_id, data):
         self._resource_id = resource_id
         self._data = data
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self._resource_id
@@ -162,7 +399,7 @@ class StdFile(fs.StdFile):
         return self._data
 
     def __str__(self):
-        return "<archfs.StdFile(resource_id={self._resource_id}, data={self._data})>".format(self=self)
+        return "<archfs.StdFile(resource_id={self._resource_id}, size={0})>".format(len(self._data), self=self)
 
 class MdlFile(fs.MdlFile):
     def __init__(self, resource_id, header, meshes_shape, lods_buffers):
@@ -170,7 +407,7 @@ class MdlFile(fs.MdlFile):
         self._header = header
         self._meshes_shape = meshes_shape
         self._lods_buffers = lods_buffers
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self._resource_id
@@ -185,14 +422,14 @@ class MdlFile(fs.MdlFile):
         return self._lods_buffers
 
     def __str__(self):
-        return "<archfs.MdlFile(resource_id={self._resource_id}, header={self._header}, meshes_shape={self._meshes_shape}, lods_buffers={self._lods_buffers})>".format(self=self)
+        return "<archfs.MdlFile(resource_id={self._resource_id}, header_size={0}, meshes_shape_size={1}, lods={2})>".format(len(self._header), len(self._meshes_shape), len(self._lods_buffers), self=self)
 
 class TexFile(fs.TexFile):
     def __init__(self, resource_id, header, mipmaps):
         self._resource_id = resource_id
         self._header = header
         self._mipmaps = mipmaps
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self._resource_id
@@ -204,4 +441,4 @@ class TexFile(fs.TexFile):
         return self._mipmaps
 
     def __str__(self):
-        return "<archfs.TexFile(resource_id={self._resource_id}, header={self._header}, mipmaps={self._mipmaps})>".format(self=self)
+        return "<archfs.TexFile(resource_id={self._resource_id}, header_size={0}, mipmaps={1})>".format(len(self._header), len(self._mipmaps), self=self)
@@ -0,0 +1,117 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import zlib
+
+from .archfs import FileSystem
+from .rsc import path_hash
+from .fmt.index import sqpack_header, dat_offset_nb, encode_index_table, encode_index2_table, SQPACK_DAT, SQPACK_HEADER_SIZE
+from .fmt.dat import encode_std_file, encode_mdl_file, encode_tex_file
+
+logger = logging.getLogger(__name__)
+
+FOLDER_NAME_TO_DAT_ID = {
+    name: dat_id for dat_id, name in FileSystem.DAT_ID_TO_NAME.items()
+}
+
+# What the game itself puts in a dat before starting the next one
+MAX_DAT_SIZE = 0x7D000000
+# Index entries keep the dat number on 3 bits
+MAX_DAT_COUNT = 8
+
+class FolderWriter:
+    # Writes the index, index2 and dats of one folder. Entries are encoded on
+    # a thread pool (zlib releases the GIL) and written in the order they were
+    # added, so the same input always gives the same archive. At most
+    # max_in_flight entries are held in memory at once.
+    def __init__(self, base_path, folder_name, workers=None, max_in_flight=None, level=zlib.Z_DEFAULT_COMPRESSION, max_dat_size=MAX_DAT_SIZE, index2=True):
+        self.base_path = "{0}/{1}0000.win32".format(base_path, FOLDER_NAME_TO_DAT_ID[folder_name])
+        self.folder_name = folder_name
+        self.level = level
+        self.max_dat_size = max_dat_size
+        self.index2 = index2
+        workers = workers or os.cpu_count()
+        self.max_in_flight = max_in_flight or workers * 4
+        self.executor = ThreadPoolExecutor(workers)
+        self._pending = deque()
+        self._paths = set()
+        self._entries = []
+        self._dat = None
+        self._dat_nb = -1
+        if not os.path.exists(base_path):
+            os.makedirs(base_path)
+        logger.info("%s", self)
+
+    def dat_path(self, dat_nb):
+        return "{0}.dat{1}".format(self.base_path, dat_nb)
+
+    def add_std(self, path, data, stored=False):
+        self._add(path, encode_std_file, data, stored, self.level)
+
+    def add_mdl(self, path, sections, stored=False):
+        self._add(path, encode_mdl_file, sections, stored, self.level)
+
+    def add_tex(self, path, header, mipmaps, stored=False):
+        self._add(path, encode_tex_file, header, mipmaps, stored, self.level)
+
+    def _add(self, path, encode, *args):
+        path = path.lower()
+        if not path.startswith(self.folder_name + "/"):
+            raise ValueError("{0} is not in folder {1}".format(path, self.folder_name))
+        if path in self._paths:
+            raise ValueError("Duplicate path: {}".format(path))
+        self._paths.add(path)
+
+        self._pending.append((path, self.executor.submit(encode, *args)))
+        while len(self._pending) > self.max_in_flight:
+            self._write(*self._pending.popleft())
+
+    def _next_dat(self):
+        if self._dat is not None:
+            self._dat.close()
+        self._dat_nb += 1
+        if self._dat_nb >= MAX_DAT_COUNT:
+            raise RuntimeError("A folder cannot span more than {} dats".format(MAX_DAT_COUNT))
+        self._dat = open(self.dat_path(self._dat_nb), "wb")
+        self._dat.write(sqpack_header(SQPACK_DAT))
+        self._dat.write(b"\x00" * SQPACK_HEADER_SIZE)
+
+    def _write(self, path, future):
+        chunks = future.result()
+        size = sum(len(chunk) for chunk in chunks)
+        if self._dat is None or (self._dat.tell() + size > self.max_dat_size and self._dat.tell() > SQPACK_HEADER_SIZE * 2):
+            self._next_dat()
+
+        offset = self._dat.tell()
+        for chunk in chunks:
+            self._dat.write(chunk)
+        self._entries.append((path, dat_offset_nb(self._dat_nb, offset)))
+
+    def close(self):
+        while self._pending:
+            self._write(*self._pending.popleft())
+        self.executor.shutdown()
+        if self._dat is None:
+            self._next_dat()
+        self._dat.close()
+
+        index_entries = []
+        for path, offset_nb in self._entries:
+            dirname, filename = path.rsplit("/", 1)
+            index_entries.append((path_hash(dirname), path_hash(filename), offset_nb))
+        with open("{}.index".format(self.base_path), "wb") as f:
+            f.write(encode_index_table(index_entries))
+        if self.index2:
+            with open("{}.index2".format(self.base_path), "wb") as f:
+                f.write(encode_index2_table([(path_hash(path), offset_nb) for path, offset_nb in self._entries]))
+        logger.info("Folder written: %s (%d files, %d dats)", self.base_path, len(self._entries), self._dat_nb + 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        return "<archwriter.FolderWriter(base_path={self.base_path}, max_in_flight={self.max_in_flight})>".format(self=self)
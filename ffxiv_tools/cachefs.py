@@ -0,0 +1,150 @@
+from hashlib import sha1
+import logging
+import mmap
+import os
+import threading
+
+from . import fs
+from .archfs import FileRef as ArchFileRef, NonFile, StdFile, MdlFile, TexFile
+from .utils import lazy_attribute
+from .fmt.payload import write_payload, read_payload
+
+logger = logging.getLogger(__name__)
+
+FILE_TYPE_TO_ENTRY_TYPE = {
+    file_type: entry_type for entry_type, file_type in ArchFileRef.ENTRY_TYPE_TO_FILE_TYPE.items()
+}
+
+def file_buffers(f):
+    file_type = f.type()
+    if file_type == fs.FileType.STD:
+        return [f.data()]
+    elif file_type == fs.FileType.MDL:
+        return [f.header(), f.meshes_shape()] + [buffer for lod_buffers in f.lods_buffers() for buffer in lod_buffers]
+    elif file_type == fs.FileType.TEX:
+        return [f.header()] + list(f.mipmaps())
+    return []
+
+def file_from_buffers(resource_id, entry_type, buffers):
+    file_type = ArchFileRef.ENTRY_TYPE_TO_FILE_TYPE[entry_type]
+    if file_type == fs.FileType.STD:
+        return StdFile(resource_id, buffers[0])
+    elif file_type == fs.FileType.MDL:
+        return MdlFile(resource_id, buffers[0], buffers[1], [buffers[i:i + 2] for i in range(2, len(buffers), 2)])
+    elif file_type == fs.FileType.TEX:
+        return TexFile(resource_id, buffers[0], buffers[1:])
+    return NonFile(resource_id)
+
+class FileSystem(fs.FileSystem):
+    def __init__(self, fs, path):
+        self.fs = fs
+        self.path = path
+        logger.info("%s", self)
+
+    @lazy_attribute
+    def _folders(self):
+        return {
+            folder.name(): Folder(folder, self.path) for folder in self.fs.folders()
+        }
+
+    def folders(self):
+        return self._folders.values()
+
+    def folder(self, folder_name):
+        return self._folders[folder_name]
+
+    @property
+    def paths(self):
+        # Known paths are those of the wrapped file system
+        return self.fs.paths
+
+    def close(self):
+        self.fs.close()
+
+    def __str__(self):
+        return "<cachefs.FileSystem(fs={self.fs}, path={self.path})>".format(self=self)
+
+class Folder(fs.Folder):
+    def __init__(self, folder, path):
+        self.folder = folder
+        self.path = path
+        logger.info("%s", self)
+
+    def name(self):
+        return self.folder.name()
+
+    @lazy_attribute
+    def cache_path(self):
+        # Entries are only valid for one version of the index, a patched game
+        # gets a fresh directory
+        index_stat = os.stat(self.folder.index_path())
+        identity = "{0}:{1}:{2}".format(os.path.abspath(self.folder.index_path()), index_stat.st_size, index_stat.st_mtime_ns)
+        return os.path.join(self.path, "{0}_{1}".format(self.folder.name(), sha1(bytes(identity, "utf-8")).hexdigest()[:16]))
+
+    def files(self):
+        for file_ref in self.folder.files():
+            yield FileRef(self, file_ref)
+
+    def file(self, resource_id):
+        return FileRef(self, self.folder.file(resource_id))
+
+    def files_in_dir(self, dirname_hash):
+        for file_ref in self.folder.files_in_dir(dirname_hash):
+            yield FileRef(self, file_ref)
+
+    def files_named(self, filename_hash):
+        for file_ref in self.folder.files_named(filename_hash):
+            yield FileRef(self, file_ref)
+
+    def has_file(self, dirname_hash, filename_hash):
+        return self.folder.has_file(dirname_hash, filename_hash)
+
+    def scan_headers(self):
+        self.folder.scan_headers()
+
+    def __str__(self):
+        return "<cachefs.Folder(folder={self.folder}, path={self.path})>".format(self=self)
+
+class FileRef(fs.FileRef):
+    def __init__(self, folder, file_ref):
+        self.folder = folder
+        self.file_ref = file_ref
+
+    def resource_id(self):
+        return self.file_ref.resource_id()
+
+    def type(self):
+        return self.file_ref.type()
+
+    def size(self):
+        return self.file_ref.size()
+
+    def stored_size(self):
+        return self.file_ref.stored_size()
+
+    def entry_path(self):
+        return os.path.join(
+            self.folder.cache_path,
+            os.path.basename(self.file_ref.dat_path).rsplit(".", 1)[-1],
+            "{:010X}".format(self.file_ref.offset)
+        )
+
+    def get(self):
+        entry_path = self.entry_path()
+        if os.path.exists(entry_path):
+            with open(entry_path, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            # The mapping lives as long as the returned buffers
+            return file_from_buffers(self.resource_id(), *read_payload(m))
+
+        rv = self.file_ref.get()
+        if not os.path.exists(os.path.dirname(entry_path)):
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = "{0}.{1}.{2}.tmp".format(entry_path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            write_payload(f, FILE_TYPE_TO_ENTRY_TYPE[rv.type()], file_buffers(rv))
+        os.replace(tmp_path, entry_path)
+        return rv
+
+    def __str__(self):
+        return "<cachefs.FileRef(file_ref={self.file_ref})>".format(self=self)
@@ -1,5 +1,5 @@
 import os
-from time import strftime, gmtime
+from time import strftime, gmtime, perf_counter
 import inspect
 import sys
 import argparse
@@ -8,15 +8,14 @@ import logging
 import math
 from itertools import chain, islice
 
-from binr.debug import launch_server
-
+# Subsystems (binr, bottle, the file systems, models...) are imported by the
+# commands that use them, so that a short command only loads what it needs
+from . import stats
 from .fs import FileType 
-from .archfs import FileSystem as archfs
-from .fsdt import DataTables as fsdt
-from .utils import print_table
-from .fsrsc import ResourceManager as fsrsc
+from .utils import print_table, parse_size
 from .rsc import resource_id_from_filepath, ResourceId
-from .mdl_viewer import Server as MdlViewer
+
+logger = logging.getLogger(__name__)
 
 LIB_PATH = os.path.dirname(os.path.abspath(os.path.join(inspect.getfile(inspect.currentframe()), "..")))
 
@@ -52,11 +51,12 @@ def view_fs(conf, args):
 
 def view_folder(conf, args):
     folder = get_fs(conf, args).folder(args.folder)
+    folder.scan_headers()
     print(">>> folder")
     print(folder)
     print()
     print(">>> files")
-    print_table(["TYPE", "DIRNAME_HASH", "FILENAME_HASH"], ((file.type(), "{:08X}".format(file.resource_id().dirname_hash), "{:08X}".format(file.resource_id().filename_hash)) for file in folder.files()))
+    print_table(["TYPE", "DIRNAME_HASH", "FILENAME_HASH", "SIZE", "STORED_SIZE", "PATH"], ((file.type(), "{:08X}".format(file.resource_id().dirname_hash), "{:08X}".format(file.resource_id().filename_hash), file.size(), file.stored_size(), file.resource_id().path or "") for file in folder.files()))
 
 def view_sub_folder(conf, args):
     if args.n:
@@ -66,7 +66,7 @@ def view_sub_folder(conf, args):
     elif args.r:
         args.r = "{}-00000000".format(args.r)
     resource_id = get_resource_id(args)
-    folder = get_fs(conf, args).folder(resource_id.folder_name)
+    fs = get_fs(conf, args)
     print(">>> sub_folder")
     print(resource_id)
     print()
@@ -74,7 +74,7 @@ def view_sub_folder(conf, args):
     print_table(
         ["TYPE", "DIRNAME_HASH", "FILENAME_HASH"], 
         ((file.type(), "{:08X}".format(file.resource_id().dirname_hash), "{:08X}".format(file.resource_id().filename_hash)) 
-            for file in filter(lambda f: f.resource_id().dirname_hash == resource_id.dirname_hash, folder.files())
+            for file in fs.files_in_dir(resource_id.folder_name, resource_id.dirname_hash)
         )
     )
 
@@ -92,7 +92,7 @@ def find_file(conf, args):
         print_table(
             ["TYPE", "DIRNAME_HASH", "FILENAME_HASH"], 
             ((file.type(), "{:08X}".format(file.resource_id().dirname_hash), "{:08X}".format(file.resource_id().filename_hash)) 
-                for file in filter(lambda f: f.resource_id().filename_hash == resource_id.filename_hash, folder.files())
+                for file in folder.files_named(resource_id.filename_hash)
             )
         )
         print()
@@ -141,12 +141,101 @@ def view_file(conf, args):
                 print_data(lod_buffer)
                 buf.append(lod_buffer)
     if args.m and args.f:
+        from binr.debug import launch_server
         launch_server(args.m, args.f, buf[args.i])
 
+#########
+# PATHS #
+#########
+def build_paths(conf, args):
+    from .fsrsc import ResourceManager as fsrsc
+    from .pathdb import discover
+
+    fs = get_fs(conf, args)
+    db = getattr(fs, "paths", None)
+    if db is None:
+        raise RuntimeError("The fs section must set path_db")
+
+    paths = []
+    for list_path in args.l or []:
+        with open(list_path, encoding="utf-8") as f:
+            paths.extend(f)
+
+    found = discover(db, fs, fsrsc(fs), paths, get_dt(conf, args) if args.exd else None)
+    db.save()
+    print(">>> paths")
+    print_table(["NEW", "TOTAL"], [[found, len(db)]])
+
+###########
+# EXTRACT #
+###########
+def extract_files(conf, args):
+    from .extract import extract
+
+    fs = get_fs(conf, args)
+    if args.l:
+        file_refs = []
+        with open(args.l, encoding="utf-8") as f:
+            for path in (line.strip() for line in f):
+                if not path:
+                    continue
+                try:
+                    file_refs.append(fs.file(path))
+                except KeyError:
+                    logger.warning("File not found: %s", path)
+    elif args.folder:
+        if args.d:
+            file_refs = fs.files_in_dir(args.folder, int(args.d, 0x10))
+        else:
+            file_refs = fs.folder(args.folder).files()
+    else:
+        raise RuntimeError("You must specify a folder or a path list")
+
+    start = perf_counter()
+    count, size = extract(fs, file_refs, args.o, workers=args.j)
+    elapsed = perf_counter() - start
+    print(">>> extract")
+    print_table(
+        ["FILES", "BYTES", "SECONDS", "MB/S"],
+        [[count, size, "{:.2f}".format(elapsed), "{:.1f}".format(size / elapsed / (1 << 20) if elapsed else 0)]]
+    )
+
+##########
+# VERIFY #
+##########
+def verify_files(conf, args):
+    from .archfs import FileSystem as archfs
+    from .verify import verify
+
+    fs = get_fs(conf, args)
+    if not isinstance(fs, archfs):
+        raise RuntimeError("Only archfs file systems can be verified")
+    folders = [fs.folder(args.folder)] if args.folder else fs.folders()
+
+    start = perf_counter()
+    count, size, corrupt = verify(fs, chain.from_iterable(folder.files() for folder in folders), workers=args.j)
+    elapsed = perf_counter() - start
+    if corrupt:
+        print(">>> corrupt")
+        print_table(
+            ["DAT", "OFFSET", "FILES", "ERRORS"],
+            [[os.path.basename(dat_path), "{:010X}".format(offset), ", ".join(names), "; ".join(errors)] for dat_path, offset, names, errors in corrupt]
+        )
+        print()
+    print(">>> verify")
+    print_table(
+        ["FILES", "CORRUPT", "BYTES", "SECONDS", "MB/S"],
+        [[count, len(corrupt), size, "{:.2f}".format(elapsed), "{:.1f}".format(size / elapsed / (1 << 20) if elapsed else 0)]]
+    )
+    if corrupt:
+        sys.exit(1)
+
 #######
 # MDL #
 #######
 def model_viewer(conf, args):
+    from .mdl_viewer import Server as MdlViewer
+
     MdlViewer(
         get_rsc(conf, args)
     ).run(host='localhost', port=8080)
@@ -229,11 +318,27 @@ def view_row(conf, args):
 ###########
 # LOGGING #
 ###########
+LOG_LEVELS = {
+    "OFF": logging.CRITICAL + 1
+}
+
+def log_levels(value):
+    # "ffxiv_tools.fsmdl:WARNING, ffxiv_tools.archfs:OFF" as (logger, level)
+    for item in value.split(","):
+        if item.strip():
+            name, level = item.split(":")
+            level = level.strip().upper()
+            yield name.strip(), LOG_LEVELS.get(level) or logging.getLevelName(level)
+
 def setup_logging(conf, args):
     root_logger = logging.getLogger()
     for handler in root_logger.handlers:
         root_logger.removeHandler(handler)
-    root_logger.setLevel(logging.NOTSET)
+    # Loggers filter before any record is built, per object traces are debug
+    # messages and cost a level check unless --debug is given
+    root_logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    for name, level in log_levels(conf["logging"].get("levels", "")):
+        logging.getLogger(name).setLevel(level)
 
     # Console handler
     console_handler = logging.StreamHandler(stream=sys.stdout)
@@ -249,7 +354,7 @@ def setup_logging(conf, args):
 
     file_handler = logging.FileHandler(log_filename, encoding="utf-8")
     file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s <%(filename)s %(lineno)d> %(funcName)s: %(message)s"))
-    file_handler.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    file_handler.setLevel(logging.DEBUG)
     root_logger.addHandler(file_handler)
 
 ##########
@@ -262,7 +367,21 @@ def get_fs_by_name(conf, name):
     fs_section = conf["fs:{}".format(name)]
     fs_type = fs_section["type"]
     if fs_type == "archfs":
-        return archfs(fs_section["path"])
+        from .archfs import FileSystem as archfs
+        return archfs(
+            fs_section["path"],
+            snapshot_path = fs_section.get("snapshot_path"),
+            max_open_dats = fs_section.getint("max_open_dats", 16),
+            decode_threads = fs_section.getint("decode_threads", 0),
+            cache_size = parse_size(fs_section.get("cache_size", "0")),
+            path_db = fs_section.get("path_db")
+        )
+    elif fs_type == "cachefs":
+        from .cachefs import FileSystem as cachefs
+        return cachefs(get_fs_by_name(conf, fs_section["fs"]), fs_section["path"])
+    elif fs_type == "diskfs":
+        from .diskfs import FileSystem as diskfs
+        return diskfs(fs_section["path"])
 
 def get_fs(conf, args):
     fs_name = args.fs
@@ -274,7 +393,11 @@ def get_dt_by_name(conf, name):
     dt_section = conf["dt:{}".format(name)]
     dt_type = dt_section["type"]
     if dt_type == "fsdt":
-        return fsdt(get_fs_by_name(conf, dt_section["fs"]))
+        from .fsdt import DataTables as fsdt
+        return fsdt(
+            get_fs_by_name(conf, dt_section["fs"]),
+            cache_strings = dt_section.getboolean("cache_strings", False)
+        )
 
 def get_dt(conf, args):
     dt_name = args.dt
@@ -286,6 +409,7 @@ def get_rsc_by_name(conf, name):
     rsc_section = conf["rsc:{}".format(name)]
     rsc_type = rsc_section["type"]
     if rsc_type == "fsrsc":
+        from .fsrsc import ResourceManager as fsrsc
         return fsrsc(get_fs_by_name(conf, rsc_section["fs"]))
 
 def get_rsc(conf, args):
@@ -323,6 +447,7 @@ def main():
     parser.add_argument("--dt")
     parser.add_argument("--rsc")
     parser.add_argument("--debug", action="store_true", default=False)
+    parser.add_argument("--stats", action="store_true", default=False, help="print i/o and decode counters at exit")
     subparsers = parser.add_subparsers(title="sub modules")
 
     ########################
@@ -333,6 +458,33 @@ def main():
     find_file_parser.add_argument("-r", required=False, help="resource id of the file {filehash}")
     find_file_parser.set_defaults(callback=find_file)
 
+    ####################
+    # paths sub module #
+    ####################
+    paths_parser = subparsers.add_parser("paths", help="find the real paths of the indexed files")
+    paths_parser.add_argument("-l", required=False, action="append", help="file listing candidate paths, one per line")
+    paths_parser.add_argument("--exd", action="store_true", default=False, help="also try the strings of every exd table")
+    paths_parser.set_defaults(callback=build_paths)
+
+    ######################
+    # extract sub module #
+    ######################
+    extract_parser = subparsers.add_parser("extract")
+    extract_parser.add_argument("folder", nargs="?", help="folder to extract")
+    extract_parser.add_argument("-d", required=False, help="only extract this dirname hash of the folder")
+    extract_parser.add_argument("-l", required=False, help="file listing the paths to extract, one per line")
+    extract_parser.add_argument("-o", required=False, default="extract", help="output directory")
+    extract_parser.add_argument("-j", required=False, type=int, help="worker processes, defaults to the cpu count")
+    extract_parser.set_defaults(callback=extract_files)
+
+    #####################
+    # verify sub module #
+    #####################
+    verify_parser = subparsers.add_parser("verify", help="check that every entry of the dats decodes")
+    verify_parser.add_argument("folder", nargs="?", help="folder to verify, defaults to all of them")
+    verify_parser.add_argument("-j", required=False, type=int, help="worker processes, defaults to the cpu count")
+    verify_parser.set_defaults(callback=verify_files)
+
     ###########################
     # model_viewer sub module #
     ###########################
@@ -408,10 +560,19 @@ def main():
     args = parser.parse_args()
 
     setup_logging(conf, args)
-    logging.info("Executing: {}".format(sys.argv))
+    logger.info("Executing: %s", sys.argv)
 
     if not hasattr(args, "callback"):
         parser.print_help()
+    elif args.stats:
+        stats.enable()
+        try:
+            with stats.timed("cli.command"):
+                args.callback(conf, args)
+        finally:
+            print()
+            print(">>> stats")
+            print_table(["NAME", "VALUE"], stats.rows())
     else:
         args.callback(conf, args)
 
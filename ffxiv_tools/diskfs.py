@@ -0,0 +1,177 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import logging
+import mmap
+import os
+
+from . import fs
+from .archfs import FileRef as ArchFileRef, StdFile, TexFile
+from .cachefs import file_from_buffers
+from .rsc import ResourceId, path_hash
+from .utils import lazy_attribute
+from .fmt.payload import PAYLOAD_MAGIC, PAYLOAD_HEADER, read_payload
+from .fmt.tex_header import tex_mipmaps
+
+logger = logging.getLogger(__name__)
+
+# Reads a tree written by the extract command: std files as is, named tex
+# files as the game sees them, mdl files and unnamed tex files as payload
+# files. Entries whose path was not known are named
+# {folder}/~{dirname_hash}/{filename_hash}.
+
+ENTRY_TYPE_TO_FILE_TYPE = ArchFileRef.ENTRY_TYPE_TO_FILE_TYPE
+
+def path_hashes(path):
+    dirname, filename = path.rsplit("/", 1)
+    dirname_tail = dirname.rsplit("/", 1)[-1]
+    if dirname_tail.startswith("~"):
+        return None, int(dirname_tail[1:], 0x10), int(filename, 0x10)
+    return path, path_hash(dirname), path_hash(filename)
+
+def map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        # The mapping lives as long as the returned buffers
+        return memoryview(mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ))
+
+class FileSystem(fs.FileSystem):
+    def __init__(self, base_path):
+        self.base_path = base_path
+        logger.info("%s", self)
+
+    @lazy_attribute
+    def _folders(self):
+        return {
+            entry.name: Folder(
+                name = entry.name,
+                path = entry.path,
+                fs = self
+            ) for entry in os.scandir(self.base_path) if entry.is_dir()
+        }
+
+    def folders(self):
+        return self._folders.values()
+
+    def folder(self, folder_name):
+        return self._folders[folder_name]
+
+    def __str__(self):
+        return "<diskfs.FileSystem(base_path={self.base_path})>".format(self=self)
+
+class Folder(fs.Folder):
+    def __init__(self, name, path, fs):
+        self._name = name
+        self.path = path
+        self.fs = fs
+        logger.info("%s", self)
+
+    def name(self):
+        return self._name
+
+    @lazy_attribute
+    def _index(self):
+        # Same layout as the archfs index: columns sorted by (dirname_hash,
+        # filename_hash), with the relative path of every file
+        rows = []
+        for dirpath, _, filenames in os.walk(self.path):
+            relative_dirname = os.path.relpath(dirpath, self.path).replace(os.sep, "/")
+            for filename in filenames:
+                relative_path = filename if relative_dirname == "." else "{0}/{1}".format(relative_dirname, filename)
+                try:
+                    path, dirname_hash, filename_hash = path_hashes("{0}/{1}".format(self._name, relative_path).lower())
+                except (UnicodeEncodeError, ValueError):
+                    logger.warning("Ignoring %s", os.path.join(dirpath, filename))
+                    continue
+                rows.append((dirname_hash, filename_hash, path, relative_path))
+        rows.sort(key=lambda row: row[:2])
+
+        return {
+            "dirname_hashes": array("I", (row[0] for row in rows)),
+            "filename_hashes": array("I", (row[1] for row in rows)),
+            "paths": [row[2] for row in rows],
+            "relative_paths": [row[3] for row in rows]
+        }
+
+    def __len__(self):
+        return len(self._index["relative_paths"])
+
+    def _dir_range(self, dirname_hash):
+        dirname_hashes = self._index["dirname_hashes"]
+        lo = bisect_left(dirname_hashes, dirname_hash)
+        return lo, bisect_right(dirname_hashes, dirname_hash, lo)
+
+    def _position(self, dirname_hash, filename_hash):
+        lo, hi = self._dir_range(dirname_hash)
+        filename_hashes = self._index["filename_hashes"]
+        i = bisect_left(filename_hashes, filename_hash, lo, hi)
+        if i == hi or filename_hashes[i] != filename_hash:
+            raise KeyError((dirname_hash, filename_hash))
+        return i
+
+    def has_file(self, dirname_hash, filename_hash):
+        try:
+            self._position(dirname_hash, filename_hash)
+            return True
+        except KeyError:
+            return False
+
+    def _file_ref(self, i):
+        return FileRef(
+            resource_id = ResourceId(
+                folder_name = self._name,
+                dirname_hash = self._index["dirname_hashes"][i],
+                filename_hash = self._index["filename_hashes"][i],
+                path = self._index["paths"][i]
+            ),
+            path = os.path.join(self.path, self._index["relative_paths"][i])
+        )
+
+    def files(self):
+        for i in range(len(self)):
+            yield self._file_ref(i)
+
+    def files_in_dir(self, dirname_hash):
+        for i in range(*self._dir_range(dirname_hash)):
+            yield self._file_ref(i)
+
+    def file(self, resource_id):
+        return self._file_ref(self._position(resource_id.dirname_hash, resource_id.filename_hash))
+
+    def __str__(self):
+        return "<diskfs.Folder(name={self._name}, path={self.path})>".format(self=self)
+
+class FileRef(fs.FileRef):
+    def __init__(self, resource_id, path):
+        self._resource_id = resource_id
+        self.path = path
+        logger.debug("%s", self)
+
+    def resource_id(self):
+        return self._resource_id
+
+    @lazy_attribute
+    def _type(self):
+        with open(self.path, "rb") as f:
+            header = f.read(PAYLOAD_HEADER.size)
+        if len(header) == PAYLOAD_HEADER.size and header.startswith(PAYLOAD_MAGIC):
+            return ENTRY_TYPE_TO_FILE_TYPE[PAYLOAD_HEADER.unpack(header)[1]]
+        return fs.FileType.TEX if self.path.endswith(".tex") else fs.FileType.STD
+
+    def type(self):
+        return self._type
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def get(self):
+        data = map_file(self.path)
+        if data[:len(PAYLOAD_MAGIC)] == PAYLOAD_MAGIC:
+            return file_from_buffers(self._resource_id, *read_payload(data))
+        elif self.type() == fs.FileType.TEX:
+            return TexFile(self._resource_id, *tex_mipmaps(data))
+        else:
+            return StdFile(self._resource_id, data)
+
+    def __str__(self):
+        return "<diskfs.FileRef(resource_id={self._resource_id}, path={self.path})>".format(self=self)
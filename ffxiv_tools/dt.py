@@ -32,3 +32,6 @@ class LocTable:
     def row(self, id):
         raise NotImplementedError()
 
+    def to_columns(self):
+        raise NotImplementedError()
+
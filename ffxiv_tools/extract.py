@@ -0,0 +1,110 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+from . import fs
+from . import archfs
+from . import stats
+from .cachefs import file_buffers, FILE_TYPE_TO_ENTRY_TYPE
+from .rsc import ResourceId
+from .utils import bounded_map
+from .fmt.payload import write_payload
+
+logger = logging.getLogger(__name__)
+
+def output_path(resource_id):
+    if resource_id.path is not None:
+        return resource_id.path.lower()
+    # Unknown names are kept apart, grouped by directory hash
+    return "{0}/~{1:08X}/{2:08X}".format(resource_id.folder_name, resource_id.dirname_hash, resource_id.filename_hash)
+
+def write_file(path, f):
+    file_type = f.type()
+    if file_type == fs.FileType.NON:
+        return 0
+
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "wb") as out:
+        if file_type == fs.FileType.STD:
+            out.write(f.data())
+        elif file_type == fs.FileType.TEX and path.endswith(".tex"):
+            # header followed by the mipmaps is the .tex file as the game sees it
+            out.write(f.header())
+            for mipmap in f.mipmaps():
+                out.write(mipmap)
+        else:
+            # the original .mdl header is not stored in the dat, sections are
+            # kept in a payload file instead, as are textures with no known
+            # name so that they can still be told apart from std files
+            write_payload(out, FILE_TYPE_TO_ENTRY_TYPE[file_type], file_buffers(f))
+        return out.tell()
+
+################################################################################
+# workers
+################################################################################
+
+# One archfs per worker process, it owns the pooled mmaps of that worker
+WORKER_FS = None
+
+def init_worker(base_path, max_open_dats, stats_enabled):
+    global WORKER_FS
+    WORKER_FS = archfs.FileSystem(base_path, max_open_dats=max_open_dats)
+    stats.enable(stats_enabled)
+
+def extract_chunk(jobs):
+    # (bytes written, stats of the chunk)
+    rv = 0
+    for dat_path, offset, folder_name, dirname_hash, filename_hash, path, out_path in jobs:
+        file_ref = archfs.FileRef(
+            resource_id = ResourceId(folder_name, dirname_hash, filename_hash, path),
+            dat_path = dat_path,
+            offset = offset,
+            fs = WORKER_FS
+        )
+        rv += write_file(out_path, file_ref.get())
+    return rv, stats.snapshot(reset=True) if stats.ENABLED else None
+
+################################################################################
+# extraction
+################################################################################
+
+def extract(file_system, file_refs, output, workers=None, chunk_size=64, max_in_flight=None):
+    file_refs = list(file_refs)
+
+    if not isinstance(file_system, archfs.FileSystem):
+        # No dat to share between processes, entries are read in place
+        return len(file_refs), sum(
+            write_file(os.path.join(output, output_path(file_ref.resource_id())), file_ref.get()) for file_ref in file_refs
+        )
+
+    # Offset order turns the reads of every dat into one sequential scan
+    jobs = sorted(
+        [
+            (
+                file_ref.dat_path,
+                file_ref.offset,
+                file_ref.resource_id().folder_name,
+                file_ref.resource_id().dirname_hash,
+                file_ref.resource_id().filename_hash,
+                file_ref.resource_id().path,
+                os.path.join(output, output_path(file_ref.resource_id()))
+            ) for file_ref in file_refs
+        ],
+        key=lambda job: job[:2]
+    )
+
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 2
+    chunks = (jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size))
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(file_system.base_path, file_system.mmaps.max_open, stats.ENABLED)) as executor:
+        # Only a few chunks are queued at once so decoded data never piles up
+        size = 0
+        for written_size, chunk_stats in bounded_map(executor, extract_chunk, chunks, max_in_flight):
+            size += written_size
+            stats.merge(chunk_stats)
+
+    logger.info("Extracted %d files (%d bytes) to %s", len(jobs), size, output)
+    return len(jobs), size
@@ -1,37 +1,75 @@
-from io import BytesIO
+from itertools import accumulate
+import struct
 import zlib
 
 import binr
 import binr.types as t
 
+from .. import stats
 from ..utils import nt
 
-@binr.struct
-def file(c, offset):
-    fh = file_header(c, offset)
-    return file_with_header(c, fh, offset)
+FILE_HEADER = struct.Struct("<III")
+BLOCK_HEADER = struct.Struct("<I4xII")
+UNCOMPRESSED_BLOCK_SIZE = 32000
 
-@binr.struct
-def file_with_header(c, fh, offset):
-    c.seek(offset + 0x14)
+# Entries and their blocks start on 0x80 boundaries, a block holds at most
+# 16000 bytes so that its sizes fit the uint16 fields of the block tables
+ENTRY_ALIGNMENT = 0x80
+BLOCK_SIZE = 16000
+
+# Below that, handing blocks over to threads costs more than it saves
+PARALLEL_MIN_BLOCKS = 4
+
+def read_file(data, offset, fh=None, executor=None):
+    stats.add("dat.files")
+    with stats.timed("dat.read_file"):
+        return _read_file(data, offset, fh, executor)
+
+def _read_file(data, offset, fh, executor):
+    if fh is None:
+        fh = binr.read(file_header, data, offset)
+    layout = binr.read(file_layout, data, fh, offset)
     value = None
 
     if fh.entry_type == 0x01:
         pass
     elif fh.entry_type == 0x02:
-        value = std_file(c, fh, offset)
+        value = decompress_sections(data, [layout.block_offsets], executor)[0]
     elif fh.entry_type == 0x03:
-        value = mdl_file(c, fh, offset)
+        blocks = decompress_sections(data, layout.sections, executor)
+        value = nt("MdlFile",
+            ("header"       , blocks[1]),
+            ("meshes_shape" , blocks[0]),
+            ("lods_buffers" , [
+                [ blocks[i + 2], blocks[i + 8] ] for i in range(3)
+            ])
+        )
     elif fh.entry_type == 0x04:
-        value = tex_file(c, fh, offset)
-    else:
-        raise NotImplementedError("Unknown entry_type: {0}".format(fh.entry_type))
+        value = nt("TexFile",
+            ("header"  , layout.header),
+            ("mipmaps" , decompress_sections(data, layout.mipmaps, executor))
+        )
 
-    return nt("File", 
+    return nt("File",
         ("header" , fh),
         ("value" , value)
     )
 
+@binr.struct
+def file_layout(c, fh, offset):
+    c.seek(offset + 0x14)
+
+    if fh.entry_type == 0x01:
+        return None
+    elif fh.entry_type == 0x02:
+        return std_file(c, fh, offset)
+    elif fh.entry_type == 0x03:
+        return mdl_file(c, fh, offset)
+    elif fh.entry_type == 0x04:
+        return tex_file(c, fh, offset)
+    else:
+        raise NotImplementedError("Unknown entry_type: {0}".format(fh.entry_type))
+
 @binr.struct
 def file_header(c, offset):
     c.seek(offset)
@@ -42,18 +80,259 @@ def file_header(c, offset):
         ("uncompressed_size" , t.uint32(c))
     )
 
-def decompress_block(c, offset, output):
-    c.seek(offset)
+def scan_file_headers(data, offsets):
+    # (header size, entry type, uncompressed size, stored size) of the entries
+    # at offsets, which must be sorted: an entry is stored up to the next one
+    rv = []
+    end = len(data)
+    for i in range(len(offsets) - 1, -1, -1):
+        if i + 1 < len(offsets) and offsets[i + 1] != offsets[i]:
+            end = offsets[i + 1]
+        rv.append(FILE_HEADER.unpack_from(data, offsets[i]) + (end - offsets[i], ))
+    rv.reverse()
+    return rv
 
-    size = t.uint32(c)
-    c.skip(0x04)
-    compressed_size = t.uint32(c)
-    uncompressed_size = t.uint32(c)
+################################################################################
+# blocks
+################################################################################
+
+def block_header(data, offset):
+    size, compressed_size, uncompressed_size = BLOCK_HEADER.unpack_from(data, offset)
+    return nt("BlockHeader",
+        ("offset"            , offset),
+        ("size"              , size),
+        ("compressed_size"   , compressed_size),
+        ("uncompressed_size" , uncompressed_size)
+    )
 
-    if compressed_size == 32000: # means uncompressed
-        output.write(t.raw(c, uncompressed_size))
+def is_stored(header):
+    return header.compressed_size == UNCOMPRESSED_BLOCK_SIZE
+
+def decompress_block(data, header, output, output_offset):
+    start = header.offset + BLOCK_HEADER.size
+    end = output_offset + header.uncompressed_size
+    if stats.ENABLED:
+        stats.add("dat.blocks")
+        stats.add("dat.compressed_bytes", header.uncompressed_size if is_stored(header) else header.compressed_size)
+        stats.add("dat.uncompressed_bytes", header.uncompressed_size)
+
+    if is_stored(header):
+        block = data[start:start + header.uncompressed_size]
     else:
-        output.write(zlib.decompress(t.raw(c, compressed_size), -15)) # zlib without header
+        block = zlib.decompress(data[start:start + header.compressed_size], -15) # zlib without header
+    # A block of the wrong size would resize output and shift the next ones
+    if len(block) != header.uncompressed_size:
+        raise ValueError("block 0x{0:X}: decoded {1} bytes instead of {2}".format(header.offset, len(block), header.uncompressed_size))
+    output[output_offset:end] = block
+
+def decompress_sections(data, sections, executor=None):
+    # All the blocks of a file are decoded into one buffer, each block knowing
+    # its output offset upfront from the block headers, so they can be
+    # decompressed in any order and on several threads (zlib releases the GIL).
+    # Reads go through a memoryview so compressed and stored data are never
+    # copied out of the dat, and a section made of a single stored block is
+    # not copied at all but returned as a view over the dat itself.
+    data = memoryview(data)
+    sections_headers = [[block_header(data, block_offset) for block_offset in section] for section in sections]
+
+    headers = []
+    output_offsets = [0]
+    for section_headers in sections_headers:
+        if len(section_headers) != 1 or not is_stored(section_headers[0]):
+            for header in section_headers:
+                headers.append(header)
+                output_offsets.append(output_offsets[-1] + header.uncompressed_size)
+    output = bytearray(output_offsets[-1])
+
+    with stats.timed("dat.decompress"):
+        if executor is not None and len(headers) >= PARALLEL_MIN_BLOCKS:
+            for _ in executor.map(decompress_block, [data] * len(headers), headers, [output] * len(headers), output_offsets):
+                pass
+        else:
+            for header, output_offset in zip(headers, output_offsets):
+                decompress_block(data, header, output, output_offset)
+
+    view = memoryview(output)
+    rv = []
+    block_id = 0
+    for section_headers in sections_headers:
+        if len(section_headers) == 1 and is_stored(section_headers[0]):
+            start = section_headers[0].offset + BLOCK_HEADER.size
+            rv.append(data[start:start + section_headers[0].uncompressed_size])
+            stats.add("dat.zero_copy_blocks")
+        else:
+            rv.append(view[output_offsets[block_id]:output_offsets[block_id + len(section_headers)]])
+            block_id += len(section_headers)
+    return rv
+
+################################################################################
+# integrity
+################################################################################
+
+def check_block(data, offset, end):
+    # Decodes one block and returns its stored size, raises ValueError when
+    # it does not decode to what its header says
+    header = block_header(data, offset)
+    if header.size != BLOCK_HEADER.size:
+        raise ValueError("block 0x{0:X}: bad header size 0x{1:X}".format(offset, header.size))
+
+    start = offset + BLOCK_HEADER.size
+    size = header.uncompressed_size if is_stored(header) else header.compressed_size
+    if start + size > end:
+        raise ValueError("block 0x{0:X}: 0x{1:X} bytes past the end of the entry".format(offset, start + size - end))
+
+    if stats.ENABLED:
+        stats.add("dat.blocks")
+        stats.add("dat.compressed_bytes", size)
+        stats.add("dat.uncompressed_bytes", header.uncompressed_size)
+
+    if not is_stored(header):
+        try:
+            with stats.timed("dat.decompress"):
+                decoded_size = len(zlib.decompress(data[start:start + size], -15, header.uncompressed_size))
+        except zlib.error as e:
+            raise ValueError("block 0x{0:X}: {1}".format(offset, e))
+        if decoded_size != header.uncompressed_size:
+            raise ValueError("block 0x{0:X}: decoded {1} bytes instead of {2}".format(offset, decoded_size, header.uncompressed_size))
+    return BLOCK_HEADER.size + size, header.uncompressed_size
+
+def check_file(data, offset, end=None):
+    # (bytes read, errors) of the entry at offset, stored up to end. Every
+    # block is decoded, and the decoded sizes must add up to what the entry
+    # says: the uncompressed size of the file header for std and tex entries,
+    # the uncompressed size of every section for mdl entries.
+    stats.add("dat.files")
+    data = memoryview(data)
+    end = len(data) if end is None else min(end, len(data))
+    try:
+        fh = binr.read(file_header, data, offset)
+        layout = binr.read(file_layout, data, fh, offset)
+    except Exception as e:
+        return 0, ["header: {}".format(e)]
+
+    if fh.entry_type == 0x01:
+        return fh.size, []
+    elif fh.entry_type == 0x02:
+        sections = [layout.block_offsets]
+        expected_size = fh.uncompressed_size
+    elif fh.entry_type == 0x03:
+        sections = layout.sections
+        expected_size = fh.uncompressed_size - MDL_FILE_HEADER_SIZE
+    else:
+        sections = layout.mipmaps
+        expected_size = fh.uncompressed_size - len(layout.header)
+
+    read_size = fh.size
+    section_sizes = []
+    errors = []
+    for section in sections:
+        section_sizes.append(0)
+        for block_offset in section:
+            try:
+                block_read_size, block_decoded_size = check_block(data, block_offset, end)
+                read_size += block_read_size
+                section_sizes[-1] += block_decoded_size
+            except (ValueError, struct.error) as e:
+                errors.append(str(e))
+    if errors:
+        return read_size, errors
+
+    if fh.entry_type == 0x03:
+        for i, (section_size, uncompressed_size) in enumerate(zip(section_sizes, layout.block_headers.uncompressed_sizes)):
+            if section_size != uncompressed_size:
+                errors.append("section {0}: decoded {1} bytes instead of {2}".format(i, section_size, uncompressed_size))
+    if not errors and sum(section_sizes) != expected_size:
+        errors.append("decoded {0} bytes instead of {1}".format(sum(section_sizes), expected_size))
+    return read_size, errors
+
+################################################################################
+# encoding
+################################################################################
+
+STD_FILE_BLOCK_HEADER = struct.Struct("<IHH")
+TEX_MIPMAP_BLOCK_HEADER = struct.Struct("<IIIII")
+MDL_FILE_HEADER_SIZE = 0x44
+
+def encode_block(data, stored=False, level=zlib.Z_DEFAULT_COMPRESSION):
+    payload = data
+    if not stored:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15) # zlib without header
+        payload = compressor.compress(data) + compressor.flush()
+        # Data that does not shrink is kept as is
+        stored = len(payload) >= len(data)
+    if stored:
+        payload = bytes(data)
+
+    block = BLOCK_HEADER.pack(BLOCK_HEADER.size, UNCOMPRESSED_BLOCK_SIZE if stored else len(payload), len(data)) + payload
+    return block + b"\x00" * (-len(block) % ENTRY_ALIGNMENT)
+
+def encode_blocks(data, stored=False, level=zlib.Z_DEFAULT_COMPRESSION):
+    data = memoryview(data).cast("B")
+    return [encode_block(data[i:i + BLOCK_SIZE], stored, level) for i in range(0, len(data), BLOCK_SIZE)]
+
+def encode_entry(entry_type, uncompressed_size, layout, chunks):
+    # Chunks are returned as a list, written one after the other they make the
+    # entry, padded up to the next entry
+    size = FILE_HEADER.size + 0x08 + len(layout)
+    size += -size % ENTRY_ALIGNMENT
+    header = FILE_HEADER.pack(size, entry_type, uncompressed_size) + b"\x00" * 0x08 + layout
+    chunks = [header + b"\x00" * (size - len(header))] + chunks
+    chunks.append(b"\x00" * (-sum(len(chunk) for chunk in chunks) % ENTRY_ALIGNMENT))
+    return chunks
+
+def encode_std_file(data, stored=False, level=zlib.Z_DEFAULT_COMPRESSION):
+    data = memoryview(data).cast("B")
+    blocks = encode_blocks(data, stored, level)
+
+    layout = [struct.pack("<I", len(blocks))]
+    offset = 0
+    for i, block in enumerate(blocks):
+        layout.append(STD_FILE_BLOCK_HEADER.pack(offset, len(block), len(data[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE])))
+        offset += len(block)
+    return encode_entry(0x02, len(data), b"".join(layout), blocks)
+
+def encode_mdl_file(sections, stored=False, level=zlib.Z_DEFAULT_COMPRESSION):
+    # sections in dat order: meshes shape, header, then the vertex, edge
+    # geometry and index buffers of the 3 lods
+    if len(sections) != MDL_FILE_BLOCK_HEADERS_COUNT:
+        raise ValueError("An mdl entry has {0} sections, not {1}".format(MDL_FILE_BLOCK_HEADERS_COUNT, len(sections)))
+    sections_blocks = [encode_blocks(section, stored, level) for section in sections]
+
+    uncompressed_sizes = [memoryview(section).nbytes for section in sections]
+    sizes = [sum(len(block) for block in section_blocks) for section_blocks in sections_blocks]
+    offsets = list(accumulate([0] + sizes[:-1]))
+    block_counts = [len(section_blocks) for section_blocks in sections_blocks]
+    block_id_starts = list(accumulate([0] + block_counts[:-1]))
+    blocks = [block for section_blocks in sections_blocks for block in section_blocks]
+
+    layout = struct.pack(
+        "<I{0}I{0}I{0}I{0}H{0}H8x{1}H".format(MDL_FILE_BLOCK_HEADERS_COUNT, len(blocks)),
+        0,
+        *(uncompressed_sizes + sizes + offsets + block_id_starts + block_counts + [len(block) for block in blocks])
+    )
+    return encode_entry(0x03, MDL_FILE_HEADER_SIZE + sum(uncompressed_sizes), layout, blocks)
+
+def encode_tex_file(header, mipmaps, stored=False, level=zlib.Z_DEFAULT_COMPRESSION):
+    # The tex header is stored raw in front of the compressed mipmaps
+    if not mipmaps:
+        raise ValueError("A tex entry needs at least one mipmap")
+    header = bytes(header)
+
+    layout = [struct.pack("<I", len(mipmaps))]
+    block_sizes = []
+    blocks = []
+    offset = len(header)
+    uncompressed_size = len(header)
+    for mipmap in mipmaps:
+        mipmap_blocks = encode_blocks(mipmap, stored, level)
+        size = sum(len(block) for block in mipmap_blocks)
+        layout.append(TEX_MIPMAP_BLOCK_HEADER.pack(offset, size, memoryview(mipmap).nbytes, len(block_sizes), len(mipmap_blocks)))
+        block_sizes.extend(len(block) for block in mipmap_blocks)
+        blocks.extend(mipmap_blocks)
+        offset += size
+        uncompressed_size += memoryview(mipmap).nbytes
+    layout.append(struct.pack("<{}H".format(len(block_sizes)), *block_sizes))
+    return encode_entry(0x04, uncompressed_size, b"".join(layout), [header] + blocks)
 
 ################################################################################
 # std file
@@ -62,18 +341,48 @@ def decompress_block(c, offset, output):
 @binr.struct
 def std_file(c, fh, file_offset):
     block_count = t.uint32(c)
+    block_headers = t.array(c, std_file_block_header, block_count)
+
+    return nt("StdFileLayout",
+        ("block_headers" , block_headers),
+        ("block_offsets" , [file_offset + fh.size + block_header.offset for block_header in block_headers])
+    )
 
-    output = BytesIO()
-    for block_header in t.array(c, std_file_block_header, block_count):
-        decompress_block(c, file_offset + fh.size + block_header.offset, output)
-    output.flush()
-    output.seek(0)
+def std_block_ranges(layout):
+    # (output offset, uncompressed size, block offset) of every block, taken
+    # from the block table so no block header has to be read
+    rv = []
+    output_offset = 0
+    for block_header, block_offset in zip(layout.block_headers, layout.block_offsets):
+        rv.append((output_offset, block_header.uncompressed_size, block_offset))
+        output_offset += block_header.uncompressed_size
+    return rv
 
-    return output.getbuffer()
+def decompress_std_block(data, block_offset):
+    header = block_header(data, block_offset)
+    output = bytearray(header.uncompressed_size)
+    decompress_block(memoryview(data), header, output, 0)
+    return memoryview(output)
+
+def read_std_range(data, offset, fh, start, length=None):
+    if start < 0 or (length is not None and length < 0):
+        raise ValueError("Invalid range: start={0}, length={1}".format(start, length))
+    layout = binr.read(file_layout, data, fh, offset)
+    end = fh.uncompressed_size if length is None else min(start + length, fh.uncompressed_size)
+
+    output = bytearray(max(end - start, 0))
+    for block_start, block_size, block_offset in std_block_ranges(layout):
+        if block_start + block_size <= start or block_start >= end:
+            continue
+        block = decompress_std_block(data, block_offset)
+        lo = max(start, block_start)
+        hi = min(end, block_start + block_size)
+        output[lo - start:hi - start] = block[lo - block_start:hi - block_start]
+    return memoryview(output)
 
 @binr.struct
 def std_file_block_header(c):
-    return nt("StdFileBlockHeader", 
+    return nt("StdFileBlockHeader",
         ("offset"            , t.uint32(c)),
         ("size"              , t.uint16(c)),
         ("uncompressed_size" , t.uint16(c))
@@ -91,23 +400,18 @@ def mdl_file(c, fh, file_offset):
     block_count = block_headers.block_id_starts[-1] + block_headers.block_counts[-1]
     block_sizes = t.array(c, t.uint16, block_count)
 
-    blocks = []
+    sections = []
     for i in range(MDL_FILE_BLOCK_HEADERS_COUNT):
-        output = BytesIO()
+        block_offsets = []
         current_offset = file_offset + fh.size + block_headers.offsets[i]
         for block_id in range(block_headers.block_counts[i]):
-            decompress_block(c, current_offset, output)
+            block_offsets.append(current_offset)
             current_offset += block_sizes[block_headers.block_id_starts[i] + block_id]
-        output.flush()
-        output.seek(0)
-        blocks.append(output.getbuffer())
-
-    return nt("MdlFile", 
-        ("header"       , blocks[1]),
-        ("meshes_shape" , blocks[0]),
-        ("lods_buffers" , [
-            [ blocks[i + 2], blocks[i + 8] ] for i in range(3)
-        ])
+        sections.append(block_offsets)
+
+    return nt("MdlFileLayout",
+        ("block_headers" , block_headers),
+        ("sections"      , sections)
     )
 
 @binr.struct
@@ -143,23 +447,22 @@ def tex_file(c, fh, file_offset):
 
     mipmaps = []
     for mipmap_block_header in mipmap_block_headers:
-        output = BytesIO()
+        block_offsets = []
         current_offset = file_offset + fh.size + mipmap_block_header.offset
         for block_id in range(mipmap_block_header.block_count):
-            decompress_block(c, current_offset, output)
+            block_offsets.append(current_offset)
             current_offset += block_sizes[mipmap_block_header.block_id_start + block_id]
-        output.flush()
-        output.seek(0)
-        mipmaps.append(output.getbuffer())
+        mipmaps.append(block_offsets)
 
-    return nt("TexFile", 
-        ("header"  , header),
-        ("mipmaps" , mipmaps)
+    return nt("TexFileLayout",
+        ("header"                , header),
+        ("mipmap_block_headers"  , mipmap_block_headers),
+        ("mipmaps"               , mipmaps)
     )
 
 @binr.struct
 def tex_mipmap_block_header(c):
-    return nt("TexMipmapBlockHeader", 
+    return nt("TexMipmapBlockHeader",
         ("offset"            , t.uint32(c)),
         ("size"              , t.uint32(c)),
         ("uncompressed_size" , t.uint32(c)),
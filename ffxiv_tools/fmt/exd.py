@@ -1,8 +1,16 @@
+from collections import namedtuple
+from functools import total_ordering
+from operator import itemgetter
+import re
+import struct
+
 import binr
 import binr.types as t
 
 from ..utils import nt
 
+ExdRecord = namedtuple("ExdRecord", ("id", "values"))
+
 MEMBER_TYPE_TO_FUNC = {
     0x00:   "beuint32",
     0x01:   "uint8",
@@ -53,10 +61,7 @@ def exd(c, data_offset, members):
                 value = ((value >> (member.type - 0x19)) == 0x01)
 
             values.append(value)
-        records.append(nt("ExdRecord",
-            ("id"     , record_header.id),
-            ("values" , tuple(values))
-        ))
+        records.append(ExdRecord(record_header.id, tuple(values)))
     return records
 
 @binr.struct
@@ -65,3 +70,277 @@ def exd_record_header(c):
         ("id"     , t.beuint32(c)),
         ("offset" , t.beuint32(c))
     )
+
+################################################################################
+# compiled rows
+################################################################################
+
+MEMBER_TYPE_TO_FORMAT = {
+    0x00:   "I",
+    0x01:   "B",
+    0x02:   "b",
+    0x03:   "B",
+    0x04:   "h",
+    0x05:   "H",
+    0x06:   "i",
+    0x07:   "I",
+
+    0x09:   "f",
+
+    0x0B:   "Q",
+
+    0x19:   "B",
+    0x1A:   "B",
+    0x1B:   "B",
+    0x1C:   "B",
+    0x1D:   "B",
+    0x1E:   "B",
+    0x1F:   "B",
+    0x20:   "B"
+}
+
+EXD_HEADERS_SIZE = struct.Struct(">I")
+EXD_RECORD_HEADER = struct.Struct(">II")
+EXD_HEADERS_OFFSET = 0x20
+EXD_RECORD_DATA_OFFSET = 6 # record size (u32) and sub row count (u16)
+
+NUL = re.compile(b"\x00")
+
+@total_ordering
+class ExdString:
+    # A string member of a row, kept as its offset in the page and only looked
+    # up and copied when read. It stands for the bytes the exd struct returns:
+    # it compares, orders, hashes, slices and prints like them, and the other
+    # bytes methods (decode, startswith...) are those of its value.
+    __slots__ = ("data", "offset", "_end")
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+        self._end = None
+
+    def end(self):
+        # The page is searched once, re works on any buffer without a copy
+        if self._end is None:
+            self._end = NUL.search(self.data, self.offset).start()
+        return self._end
+
+    def view(self):
+        return self.data[self.offset:self.end()]
+
+    def raw(self):
+        return bytes(self.view())
+
+    def text(self):
+        return self.raw().decode("utf-8")
+
+    def __bytes__(self):
+        return self.raw()
+
+    def __len__(self):
+        return self.end() - self.offset
+
+    def __contains__(self, value):
+        return value in self.raw()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.raw()[key]
+        return self.view()[key]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getattr__(self, name):
+        if name.startswith("_"): # unset slots
+            raise AttributeError(name)
+        return getattr(self.raw(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, ExdString):
+            other = other.view()
+        return self.view() == other
+
+    def __lt__(self, other):
+        if isinstance(other, ExdString):
+            other = other.raw()
+        return self.raw() < other
+
+    def __hash__(self):
+        return hash(self.raw())
+
+    def __str__(self):
+        return str(self.raw())
+
+    def __repr__(self):
+        return repr(self.raw())
+
+class CachedExdString(ExdString):
+    # Copied and decoded once, on first read
+    __slots__ = ("_raw", "_text")
+
+    def raw(self):
+        try:
+            return self._raw
+        except AttributeError:
+            self._raw = ExdString.raw(self)
+            return self._raw
+
+    def text(self):
+        try:
+            return self._text
+        except AttributeError:
+            self._text = ExdString.text(self)
+            return self._text
+
+def exd_row_layout(data_offset, members, cache_strings=False):
+    # Compiles the members of a table (sorted by offset, as exh returns them)
+    # into one big endian struct read once per row. The bit members of a byte
+    # share the field of that byte. Members overlapping another field, which
+    # a single struct cannot express, are read on their own.
+    fmt = [">"]
+    end = 0
+    fields = {}
+    overlaps = []
+    indices = []
+    for i, member in enumerate(members):
+        member_fmt = MEMBER_TYPE_TO_FORMAT[member.type]
+        key = (member.offset, member_fmt)
+        if not key in fields:
+            if member.offset >= end:
+                if member.offset > end:
+                    fmt.append("{}x".format(member.offset - end))
+                fields[key] = len(fields)
+                fmt.append(member_fmt)
+                end = member.offset + struct.calcsize(">" + member_fmt)
+            else:
+                overlaps.append((i, member.offset, struct.Struct(">" + member_fmt)))
+        indices.append(fields.get(key, 0))
+
+    if len(indices) > 1:
+        getter = itemgetter(*indices)
+    elif indices:
+        getter = lambda values, index=indices[0]: (values[index], )
+    else:
+        getter = lambda values: ()
+
+    return nt("ExdRowLayout",
+        ("data_offset" , data_offset),
+        ("row"         , struct.Struct("".join(fmt))),
+        ("getter"      , getter),
+        ("overlaps"    , overlaps),
+        ("strings"     , [i for i, member in enumerate(members) if member.type == 0x00]),
+        ("string_type" , CachedExdString if cache_strings else ExdString),
+        ("bools"       , [i for i, member in enumerate(members) if member.type == 0x01]),
+        ("bits"        , [(i, member.type - 0x19) for i, member in enumerate(members) if member.type >= 0x19])
+    )
+
+def exd_record_headers(data):
+    headers_size, = EXD_HEADERS_SIZE.unpack_from(data, 0x08)
+    headers_size -= headers_size % EXD_RECORD_HEADER.size
+    return EXD_RECORD_HEADER.iter_unpack(data[EXD_HEADERS_OFFSET:EXD_HEADERS_OFFSET + headers_size])
+
+def exd_rows(data, layout):
+    # Same records as exd, with one unpack_from per row instead of one read
+    # per member, except for strings: they are ExdStrings instead of bytes,
+    # read from the page on access.
+    data = memoryview(data).cast("B") # strings point into the page itself
+    unpack_from = layout.row.unpack_from
+    string_type = layout.string_type
+    getter = layout.getter
+    data_offset = layout.data_offset
+
+    records = []
+    for id, offset in exd_record_headers(data):
+        offset += EXD_RECORD_DATA_OFFSET
+        values = list(getter(unpack_from(data, offset)))
+
+        for i, member_offset, member_struct in layout.overlaps:
+            values[i], = member_struct.unpack_from(data, offset + member_offset)
+        for i in layout.strings:
+            values[i] = string_type(data, offset + data_offset + values[i])
+        for i in layout.bools:
+            values[i] = (values[i] == 0x01)
+        for i, bit in layout.bits:
+            values[i] = ((values[i] >> bit) == 0x01)
+
+        records.append(ExdRecord(id, tuple(values)))
+    return records
+
+################################################################################
+# columns
+################################################################################
+
+FUNC_TO_DTYPE = {
+    "uint8"     : "u1",
+    "int8"      : "i1",
+    "beint16"   : ">i2",
+    "beuint16"  : ">u2",
+    "beint32"   : ">i4",
+    "beuint32"  : ">u4",
+    "befloat32" : ">f4",
+    "beuint64"  : ">u8"
+}
+
+def member_dtype(member):
+    if member.type == 0x01 or member.type >= 0x19:
+        return "?"
+    return FUNC_TO_DTYPE[MEMBER_TYPE_TO_FUNC[member.type]]
+
+def exd_columns(pages, data_offset, members):
+    # Decodes the pages of a table into one numpy array per member, in members
+    # order: booleans and bit flags as bool arrays, numbers with the dtype of
+    # their MEMBER_TYPE_TO_FUNC reader (in native byte order). Strings are
+    # stored in one bytes blob shared by the whole table, a string column
+    # being the n + 1 offsets of its values in that blob.
+    #
+    # numpy is optional, only this function needs it
+    import numpy as np
+
+    ids = [np.zeros(0, np.uint32)]
+    columns = [[] for _ in members]
+    for data in pages:
+        page = np.frombuffer(data, dtype="u1")
+        headers_size, = EXD_HEADERS_SIZE.unpack_from(data, 0x08)
+        headers = np.frombuffer(data, dtype=">u4", count=2 * (headers_size // EXD_RECORD_HEADER.size), offset=EXD_HEADERS_OFFSET)
+        offsets = headers[1::2].astype(np.int64) + EXD_RECORD_DATA_OFFSET
+        ids.append(headers[0::2].astype(np.uint32))
+
+        # Fixed part of every row gathered as a (rows, data_offset) byte matrix
+        rows = page[offsets[:, None] + np.arange(data_offset)]
+        nuls = np.flatnonzero(page == 0)
+        for column, member in zip(columns, members):
+            dtype = np.dtype(FUNC_TO_DTYPE[MEMBER_TYPE_TO_FUNC[member.type]])
+            values = rows[:, member.offset:member.offset + dtype.itemsize].copy().view(dtype).ravel()
+
+            if member.type == 0x00: # string
+                starts = offsets + data_offset + values
+                lengths = nuls[np.searchsorted(nuls, starts)] - starts
+                indices = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+                column.append((page[indices].tobytes(), lengths))
+            elif member.type == 0x01:
+                column.append(values == 0x01)
+            elif member.type >= 0x19: # bit types
+                column.append((values >> (member.type - 0x19)) == 0x01)
+            else:
+                column.append(values.astype(dtype.newbyteorder("=")))
+
+    blob = []
+    blob_size = 0
+    rv = []
+    for column, member in zip(columns, members):
+        if member.type == 0x00:
+            lengths = np.concatenate([np.zeros(0, np.int64)] + [lengths for _, lengths in column])
+            string_offsets = np.zeros(len(lengths) + 1, np.int64)
+            np.cumsum(lengths, out=string_offsets[1:])
+            rv.append(string_offsets + blob_size)
+            blob.extend(segment for segment, _ in column)
+            blob_size += int(string_offsets[-1])
+        else:
+            rv.append(np.concatenate(column) if column else np.zeros(0, np.dtype(member_dtype(member)).newbyteorder("=")))
+
+    return nt("ExdColumns",
+        ("ids"     , np.concatenate(ids)),
+        ("columns" , rv),
+        ("strings" , b"".join(blob))
+    )
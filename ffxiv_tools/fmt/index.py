@@ -1,8 +1,18 @@
+from array import array
+from itertools import tee
+from operator import le
+import struct
+import sys
+
 import binr
 import binr.types as t
 
 from ..utils import nt
 
+INDEX_HEADER_OFFSET = 0x408
+INDEX_ENTRY_SIZE = 0x10
+INDEX2_ENTRY_SIZE = 0x08
+
 @binr.struct
 def index(c):
     c.seek(0x408)
@@ -23,8 +33,114 @@ def index_entry(c):
     c.skip(0x04)
 
     return nt("IndexEntry",
-        ("dat_nb"          , (dat_offset_nb & 0x0F) // 0x02),
-        ("offset"          , (dat_offset_nb & 0xFFFFFFF0) * 0x08),
+        ("dat_nb"          , dat_nb(dat_offset_nb)),
+        ("offset"          , dat_offset(dat_offset_nb)),
         ("dirname_hash"    , dirname_hash),
         ("filename_hash"   , filename_hash)
     )
+
+def dat_nb(dat_offset_nb):
+    return (dat_offset_nb & 0x0F) // 0x02
+
+def dat_offset(dat_offset_nb):
+    return (dat_offset_nb & 0xFFFFFFF0) * 0x08
+
+def uint32_array(data):
+    rv = array("I")
+    rv.frombytes(data)
+    if sys.byteorder != "little":
+        rv.byteswap()
+    return rv
+
+def index_table(data):
+    # Views the whole entry table as packed uint32 words instead of parsing
+    # one IndexEntry per file, the columns are then plain strided slices
+    offset, size = struct.unpack_from("<II", data, INDEX_HEADER_OFFSET)
+    words = uint32_array(data[offset:offset + size - size % INDEX_ENTRY_SIZE])
+
+    return nt("IndexTable",
+        ("filename_hashes" , words[0::4]),
+        ("dirname_hashes"  , words[1::4]),
+        ("dat_offset_nbs"  , words[2::4])
+    )
+
+def is_sorted(keys):
+    # Walks keys once, pairwise, without building a list of them
+    keys, next_keys = tee(keys)
+    next(next_keys, None)
+    return all(map(le, keys, next_keys))
+
+def sorted_index_table(table):
+    # Columns ordered by (dirname_hash, filename_hash) so that lookups are
+    # a bisect over the dirname column then over the filename column. sqpack
+    # already stores its entries in that order, they are only sorted when not.
+    if is_sorted(zip(table.dirname_hashes, table.filename_hashes)):
+        return table._asdict()
+    keys = [(dirname_hash << 32) | filename_hash for dirname_hash, filename_hash in zip(table.dirname_hashes, table.filename_hashes)]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return {
+        name: array("I", map(column.__getitem__, order)) for name, column in table._asdict().items()
+    }
+
+def index2_table(data):
+    # index2 entries are (full path hash, dat_offset_nb) pairs
+    offset, size = struct.unpack_from("<II", data, INDEX_HEADER_OFFSET)
+    words = uint32_array(data[offset:offset + size - size % INDEX2_ENTRY_SIZE])
+
+    return nt("Index2Table",
+        ("path_hashes"    , words[0::2]),
+        ("dat_offset_nbs" , words[1::2])
+    )
+
+def sorted_index2_table(table):
+    if is_sorted(table.path_hashes):
+        return table._asdict()
+    order = sorted(range(len(table.path_hashes)), key=table.path_hashes.__getitem__)
+    return {
+        name: array("I", map(column.__getitem__, order)) for name, column in table._asdict().items()
+    }
+
+################################################################################
+# encoding
+################################################################################
+
+SQPACK_MAGIC = b"SqPack\x00\x00"
+SQPACK_HEADER_SIZE = 0x400
+SQPACK_DAT = 0x01
+SQPACK_INDEX = 0x02
+
+def sqpack_header(sqpack_type):
+    # Only the fields the readers look at are set, the sha1 digests are left
+    # zeroed
+    header = SQPACK_MAGIC + struct.pack("<4xIII", SQPACK_HEADER_SIZE, 0x01, sqpack_type)
+    return header + b"\x00" * (SQPACK_HEADER_SIZE - len(header))
+
+def dat_offset_nb(dat_nb, offset):
+    if offset % 0x80:
+        raise ValueError("Dat offsets must be aligned on 0x80: 0x{:X}".format(offset))
+    return (offset // 0x08) | (dat_nb * 0x02)
+
+def encode_index(entries, entry_size):
+    # entries are tuples of uint32 words, written as the entry table of an
+    # index right after its headers
+    words = array("I", (word for entry in entries for word in entry))
+    if sys.byteorder != "little":
+        words.byteswap()
+    data_offset = SQPACK_HEADER_SIZE * 2
+    segment_header = struct.pack("<I4xII", SQPACK_HEADER_SIZE, data_offset, len(entries) * entry_size)
+    return (
+        sqpack_header(SQPACK_INDEX) +
+        segment_header + b"\x00" * (SQPACK_HEADER_SIZE - len(segment_header)) +
+        words.tobytes()
+    )
+
+def encode_index_table(entries):
+    # entries are (dirname_hash, filename_hash, dat_offset_nb)
+    return encode_index(
+        [(filename_hash, dirname_hash, dat_offset_nb, 0) for dirname_hash, filename_hash, dat_offset_nb in sorted(entries)],
+        INDEX_ENTRY_SIZE
+    )
+
+def encode_index2_table(entries):
+    # entries are (path_hash, dat_offset_nb)
+    return encode_index(sorted(entries), INDEX2_ENTRY_SIZE)
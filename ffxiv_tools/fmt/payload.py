@@ -0,0 +1,33 @@
+import struct
+
+# Decoded dat entries written as is: an entry type, then every buffer of the
+# entry (std data, mdl sections, tex header and mipmaps) aligned so they can
+# be handed back as memoryviews over a mapping of the file
+PAYLOAD_MAGIC = b"FXPL"
+PAYLOAD_HEADER = struct.Struct("<4sII")
+PAYLOAD_ALIGNMENT = 0x10
+
+def write_payload(f, entry_type, buffers):
+    offset = PAYLOAD_HEADER.size + 8 * len(buffers)
+    f.write(PAYLOAD_HEADER.pack(PAYLOAD_MAGIC, entry_type, len(buffers)))
+    f.write(struct.pack("<{}Q".format(len(buffers)), *(len(buffer) for buffer in buffers)))
+    for buffer in buffers:
+        f.write(b"\x00" * (-offset % PAYLOAD_ALIGNMENT))
+        offset += -offset % PAYLOAD_ALIGNMENT
+        f.write(buffer)
+        offset += len(buffer)
+
+def read_payload(data):
+    magic, entry_type, buffer_count = PAYLOAD_HEADER.unpack_from(data, 0)
+    if magic != PAYLOAD_MAGIC:
+        raise RuntimeError("Not a payload file")
+    sizes = struct.unpack_from("<{}Q".format(buffer_count), data, PAYLOAD_HEADER.size)
+
+    view = memoryview(data)
+    buffers = []
+    offset = PAYLOAD_HEADER.size + 8 * buffer_count
+    for size in sizes:
+        offset += -offset % PAYLOAD_ALIGNMENT
+        buffers.append(view[offset:offset + size])
+        offset += size
+    return entry_type, buffers
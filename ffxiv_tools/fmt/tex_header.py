@@ -1,3 +1,5 @@
+import struct
+
 import binr
 import binr.types as t
 
@@ -15,3 +17,14 @@ def tex_header(c):
         ("width"  , width),
         ("height" , height)
     )
+
+TEX_MIPMAP_COUNT = struct.Struct("<B")
+TEX_SURFACE_OFFSETS = struct.Struct("<13I")
+
+def tex_mipmaps(data):
+    # Splits a whole .tex file into its header and mipmaps, a mipmap going up
+    # to the next one or to the end of the file
+    view = memoryview(data)
+    mipmap_count, = TEX_MIPMAP_COUNT.unpack_from(data, 0x0E)
+    offsets = list(TEX_SURFACE_OFFSETS.unpack_from(data, 0x1C)[:mipmap_count]) + [len(view)]
+    return view[:offsets[0]], [view[offsets[i]:offsets[i + 1]] for i in range(mipmap_count)]
@@ -1,5 +1,11 @@
 from .rsc import resource_id_from_filepath
 
+def check_range(offset, length):
+    # Ranged reads count from the start of the file, every backend rejects
+    # negative values instead of giving them its own meaning
+    if offset < 0 or (length is not None and length < 0):
+        raise ValueError("Invalid range: offset={0}, length={1}".format(offset, length))
+
 class FileSystem:
     def folders(self):
         raise NotImplementedError()
@@ -20,6 +26,22 @@ class FileSystem:
     def file_by_id(self, resource_id):
         return self.folder(resource_id.folder_name).file(resource_id)
 
+    def files_in_dir(self, folder_name, dirname_hash):
+        return self.folder(folder_name).files_in_dir(dirname_hash)
+
+    def files_named(self, filename_hash):
+        for folder in self.folders():
+            yield from folder.files_named(filename_hash)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 class Folder:
     def name(self):
         raise NotImplementedError()
@@ -30,6 +52,23 @@ class Folder:
     def file(self, resource_id):
         raise NotImplementedError()
 
+    def file_by_path(self, filepath):
+        return self.file(resource_id_from_filepath(filepath))
+
+    def scan_headers(self):
+        pass
+
+    def files_in_dir(self, dirname_hash):
+        return filter(lambda f: f.resource_id().dirname_hash == dirname_hash, self.files())
+
+    def files_named(self, filename_hash):
+        return filter(lambda f: f.resource_id().filename_hash == filename_hash, self.files())
+
+    def has_file(self, dirname_hash, filename_hash):
+        return any(
+            f.resource_id().dirname_hash == dirname_hash and f.resource_id().filename_hash == filename_hash for f in self.files()
+        )
+
 class FileType:
     NON = ""
     STD = "std"
@@ -43,9 +82,29 @@ class FileRef:
     def type(self):
         raise NotImplementedError()
 
+    def size(self):
+        raise NotImplementedError()
+
+    def stored_size(self):
+        # Bytes taken where the file is stored, files are stored as they are
+        # unless a backend compresses them
+        return self.size()
+
     def get(self):
         raise NotImplementedError()
 
+    def read(self, offset=0, length=None):
+        if self.type() != FileType.STD:
+            raise RuntimeError("Ranged reads are only available on std files")
+        check_range(offset, length)
+        data = self.get().data()
+        return data[offset:] if length is None else data[offset:offset + length]
+
+    def iter_chunks(self):
+        if self.type() != FileType.STD:
+            raise RuntimeError("Streamed reads are only available on std files")
+        yield self.get().data()
+
 class File:
     def resource_id(self):
         raise NotImplementedError()
@@ -4,20 +4,27 @@ from itertools import chain
 import binr
 
 from . import dt
+from . import stats
 from .utils import lazy_attribute
 from .fmt.exl import exl
 from .fmt.exh import exh
-from .fmt.exd import exd
+from .fmt.exd import exd_row_layout, exd_rows, exd_columns
+
+logger = logging.getLogger(__name__)
 
 class DataTables(dt.DataTables):
-    def __init__(self, fs):
+    def __init__(self, fs, cache_strings=False):
         self.fs = fs
-        logging.info(self)
+        self.cache_strings = cache_strings
+        logger.info("%s", self)
 
     @lazy_attribute
     def _tables(self):
+        data = self.fs.file("exd/root.exl").get().data()
+        with stats.timed("fsdt.exl_parse"):
+            table_names = binr.read(exl, data)
         return {
-            table_name: Table(self.fs, table_name) for table_name in binr.read(exl, self.fs.file("exd/root.exl").get().data())
+            table_name: Table(self.fs, table_name, self.cache_strings) for table_name in table_names
         }
 
     def tables(self):
@@ -41,23 +48,26 @@ class Table(dt.Table):
         7: "ko"
     }
 
-    def __init__(self, fs, name):
+    def __init__(self, fs, name, cache_strings=False):
         self.fs = fs
         self._name = name
-        logging.info(self)
+        self.cache_strings = cache_strings
+        logger.debug("%s", self)
 
     def name(self):
         return self._name
 
     @lazy_attribute
     def _loc_tables(self):
-        exh_data = binr.read(exh, self.fs.file("exd/{}.exh".format(self._name)).get().data())
+        data = self.fs.file("exd/{}.exh".format(self._name)).get().data()
+        with stats.timed("fsdt.exh_parse"):
+            exh_data = binr.read(exh, data)
 
         rv = {}
         for lang_id in exh_data.langs:
             if lang_id <= 4:
                 lang = self.LANG_ID_TO_LANG[lang_id]
-                rv[lang] = LocTable(self.fs, self._name, lang, exh_data.header.data_offset, exh_data.ids, exh_data.members)
+                rv[lang] = LocTable(self.fs, self._name, lang, exh_data.header.data_offset, exh_data.ids, exh_data.members, self.cache_strings)
 
         return rv
 
@@ -71,15 +81,16 @@ class Table(dt.Table):
         return "<fsdt.Table(fs={self.fs}, name={self._name})>".format(self=self)
 
 class LocTable(dt.LocTable):
-    def __init__(self, fs, name, lang, data_offset, ids, members):
+    def __init__(self, fs, name, lang, data_offset, ids, members, cache_strings=False):
         self.fs = fs
         self._name = name
         self._lang = lang
         self.data_offset = data_offset
         self.ids = list(sorted(ids))
         self.members = members
+        self.cache_strings = cache_strings
         self._lang_ext = "_{}".format(lang) if lang else ""
-        logging.info(self)
+        logger.debug("%s", self)
 
     def name(self):
         return self._name
@@ -87,10 +98,15 @@ class LocTable(dt.LocTable):
     def lang(self):
         return self._lang
 
+    @lazy_attribute
+    def _layout(self):
+        # Compiled once, shared by every page of the table
+        return exd_row_layout(self.data_offset, self.members, self.cache_strings)
+
     @lazy_attribute
     def _rows(self):
         return [
-            (start_id, RowsSubset(self.fs, self._name, start_id, self._lang_ext, self.data_offset, self.members)) for start_id in self.ids
+            (start_id, RowsSubset(self.fs, self._name, start_id, self._lang_ext, self._layout)) for start_id in self.ids
         ]
 
     def rows(self):
@@ -107,27 +123,34 @@ class LocTable(dt.LocTable):
             return good_subset.row(id)
         raise RuntimeError("Could not find id: {}".format(id))
 
+    def to_columns(self):
+        # Every page decoded straight into numpy arrays, see exd_columns
+        pages = [rows_subset.data() for _, rows_subset in self._rows]
+        with stats.timed("fsdt.exd_columns"):
+            return exd_columns(pages, self.data_offset, self.members)
+
     def __str__(self):
-        return "<fsdt.LocTable(fs={self.fs}, name={self._name}, lang={self._lang}, data_offset={self.data_offset}, ids={self.ids}, members={self.members})>".format(self=self)
+        return "<fsdt.LocTable(fs={self.fs}, name={self._name}, lang={self._lang}, data_offset={self.data_offset}, pages={0}, members={1})>".format(len(self.ids), len(self.members), self=self)
 
 class RowsSubset:
-    def __init__(self, fs, name, id, lang_ext, data_offset, members):
+    def __init__(self, fs, name, id, lang_ext, layout):
         self.fs = fs
         self.name = name
         self.id = id
         self.lang_ext = lang_ext
-        self.data_offset = data_offset
-        self.members = members
+        self.layout = layout
     
+    def data(self):
+        return self.fs.file("exd/{0}_{1}{2}.exd".format(self.name, self.id, self.lang_ext)).get().data()
+
     @lazy_attribute
     def _rows(self):
+        data = self.data()
+        with stats.timed("fsdt.exd_parse"):
+            records = exd_rows(data, self.layout)
+        stats.add("fsdt.rows", len(records))
         return {
-            record.id: record for record in binr.read(
-                exd, 
-                self.fs.file("exd/{0}_{1}{2}.exd".format(self.name, self.id, self.lang_ext)).get().data(), 
-                self.data_offset, 
-                self.members
-            ) 
+            record.id: record for record in records
         }
 
     def rows(self):
@@ -7,20 +7,24 @@ from .fmt.mdl_header import mdl_header
 from .fmt.mdl_meshes_shape import mdl_meshes_shape
 from .fmt.vertex_buffer import vertex_buffer
 from .fmt.index_buffer import index_buffer
+from . import stats
 from .utils import lazy_attribute
 
+logger = logging.getLogger(__name__)
+
 class Model(mdl.Model):
     def __init__(self, mdl_file):
         super().__init__()
         self.mdl_file = mdl_file
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self.mdl_file.resource_id()
 
     @lazy_attribute
     def _header(self):
-        return binr.read(mdl_header, self.mdl_file.header())
+        with stats.timed("fsmdl.header_parse"):
+            return binr.read(mdl_header, self.mdl_file.header())
 
     @lazy_attribute
     def _lods(self):
@@ -42,7 +46,8 @@ class Model(mdl.Model):
 
     @lazy_attribute
     def _meshes_shape(self):
-        return binr.read(mdl_meshes_shape, self.mdl_file.meshes_shape())
+        with stats.timed("fsmdl.meshes_shape_parse"):
+            return binr.read(mdl_meshes_shape, self.mdl_file.meshes_shape())
 
     def __str__(self):
         return "<mdl.Model(mdl_file={self.mdl_file})>".format(self=self)
@@ -56,7 +61,7 @@ class Lod(mdl.Lod):
         self.meshes_shape = meshes_shape
         self.vertex_buffer = vertex_buffer
         self.index_buffer = index_buffer
-        logging.info(self)
+        logger.debug("%s", self)
 
     @lazy_attribute
     def _meshes(self):
@@ -71,7 +76,7 @@ class Lod(mdl.Lod):
         return self._meshes[id]
 
     def __str__(self):
-        return "<mdl.Lod(header={self.header}, materials_names={self.materials_names}, meshes_headers={self.meshes_header}, meshes_shapes={self.meshes_shape}, vertex_buffer={self.vertex_buffer}, index_buffer={self.index_buffer})>".format(self=self)
+        return "<mdl.Lod(meshes={0}, vertex_buffer_size={1}, index_buffer_size={2})>".format(len(self.meshes_header), len(self.vertex_buffer), len(self.index_buffer))
 
 class Mesh(mdl.Mesh):
     def __init__(self, header, material_name, shape, vertex_buffer, index_buffer):
@@ -80,14 +85,15 @@ class Mesh(mdl.Mesh):
         self.shape = shape
         self.vertex_buffer = vertex_buffer
         self.index_buffer = index_buffer
-        logging.info(self)
+        logger.debug("%s", self)
 
     def material(self):
         return self.material_name
 
     @lazy_attribute
     def _vertex_attributes(self):
-        return binr.read(vertex_buffer, self.vertex_buffer, self.header, self.shape)
+        with stats.timed("fsmdl.vertex_decode"):
+            return binr.read(vertex_buffer, self.vertex_buffer, self.header, self.shape)
 
     @lazy_attribute
     def _positions(self):
@@ -154,10 +160,11 @@ class Mesh(mdl.Mesh):
 
     @lazy_attribute
     def _indices(self):
-        return binr.read(index_buffer, self.index_buffer, self.header)
+        with stats.timed("fsmdl.index_decode"):
+            return binr.read(index_buffer, self.index_buffer, self.header)
 
     def indices(self):
         return self._indices
 
     def __str__(self):
-        return "<mdl.Mesh(header={self.header}, material_name={self.material_name}, shape={self.shape}, vertex_buffer={self.vertex_buffer}, index_buffer={self.index_buffer})>".format(self=self)
+        return "<mdl.Mesh(material_name={self.material_name}, vertices={self.header.vert_buf_count}, indices={self.header.indices_count}, elements={0})>".format(len(self.shape), self=self)
@@ -6,11 +6,13 @@ from . import mtrl
 from .fmt.mtrl import mtrl as mtrl_struct
 from .utils import lazy_attribute
 
+logger = logging.getLogger(__name__)
+
 class Material(mtrl.Material):
     def __init__(self, mtrl_file):
         super().__init__()
         self.mtrl_file = mtrl_file
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self.mtrl_file.resource_id()
@@ -29,5 +31,8 @@ class Material(mtrl.Material):
             'normal': self._struct.textures[dt[207536625]] if 207536625 in dt else None 
         }
 
+    def texture_names(self):
+        return self._struct.textures
+
     def __str__(self):
         return "<mtrl.Material(mtrl_file={self.mtrl_file})>".format(self=self)
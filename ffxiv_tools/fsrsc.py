@@ -5,11 +5,13 @@ from .fsmdl import Model
 from .fsmtrl import Material
 from .fstex import Texture
 
+logger = logging.getLogger(__name__)
+
 class ResourceManager(rsc.ResourceManager):
     def __init__(self, fs):
         super().__init__()
         self.fs = fs
-        logging.info(self)
+        logger.info("%s", self)
 
     def get_by_id(self, resource_id):
         return self.fs.file_by_id(resource_id)
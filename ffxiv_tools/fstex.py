@@ -6,6 +6,8 @@ from . import tex
 from .fmt.tex_header import tex_header
 from .utils import lazy_attribute
 
+logger = logging.getLogger(__name__)
+
 class Texture(tex.Texture):
     TYPEID_TO_TYPE = {
         0x1441: tex.TextureType.RGB5A1,
@@ -19,7 +21,7 @@ class Texture(tex.Texture):
     def __init__(self, tex_file):
         super().__init__()
         self.tex_file = tex_file
-        logging.info(self)
+        logger.debug("%s", self)
 
     def resource_id(self):
         return self.tex_file.resource_id()
@@ -7,6 +7,9 @@ class Material:
     def textures(self):
         raise NotImplementedError()
 
+    def texture_names(self):
+        raise NotImplementedError()
+
 def mtrl_to_dict(mtrl):
     return {
         "textures": mtrl.textures()
@@ -0,0 +1,187 @@
+from array import array
+from bisect import bisect_left
+import logging
+import mmap
+import os
+import struct
+
+from .rsc import path_hash
+from .fmt.exd import ExdString
+from .utils import lazy_attribute
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FXPD"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+
+def path_key(dirname_hash, filename_hash):
+    return (dirname_hash << 32) | filename_hash
+
+def hash_paths(paths):
+    # Candidate lists share most of their directories, each dirname is only
+    # hashed once per batch
+    dirname_hashes = {}
+    for path in paths:
+        path = path.strip().lower()
+        if "/" not in path:
+            continue
+        try:
+            dirname, filename = path.rsplit("/", 1)
+            dirname_hash = dirname_hashes.get(dirname)
+            if dirname_hash is None:
+                dirname_hash = dirname_hashes[dirname] = path_hash(dirname)
+            yield path, dirname_hash, path_hash(filename)
+        except UnicodeEncodeError:
+            continue
+
+class PathDatabase:
+    def __init__(self, path=None):
+        self.path = path
+        self._added = {}
+        logger.info("%s", self)
+
+    @lazy_attribute
+    def _table(self):
+        if self.path is None or not os.path.exists(self.path):
+            return array("Q"), array("I", [0]), b""
+
+        with open(self.path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        magic, version, count = HEADER.unpack_from(m, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("Unknown path database format: {}".format(self.path))
+
+        view = memoryview(m)
+        keys_offset = HEADER.size
+        offsets_offset = keys_offset + count * 8
+        blob_offset = offsets_offset + (count + 1) * 4
+        return (
+            view[keys_offset:offsets_offset].cast("Q"),
+            view[offsets_offset:blob_offset].cast("I"),
+            view[blob_offset:]
+        )
+
+    def __len__(self):
+        keys, _, _ = self._table
+        return len(keys) + sum(1 for key in self._added if self._stored_index(key) is None)
+
+    def _stored_index(self, key):
+        keys, _, _ = self._table
+        i = bisect_left(keys, key)
+        return i if i < len(keys) and keys[i] == key else None
+
+    def find(self, dirname_hash, filename_hash):
+        key = path_key(dirname_hash, filename_hash)
+        rv = self._added.get(key)
+        if rv is None:
+            i = self._stored_index(key)
+            if i is not None:
+                _, offsets, blob = self._table
+                rv = str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+        return rv
+
+    def add(self, path, dirname_hash, filename_hash):
+        self._added[path_key(dirname_hash, filename_hash)] = path
+
+    def items(self):
+        keys, offsets, blob = self._table
+        rv = {
+            key: str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i, key in enumerate(keys)
+        }
+        rv.update(self._added)
+        return rv.items()
+
+    def save(self):
+        items = sorted(self.items())
+        offsets = array("I", [0])
+        blob = bytearray()
+        for _, path in items:
+            blob += bytes(path, "utf-8")
+            offsets.append(len(blob))
+
+        if os.path.dirname(self.path) and not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        tmp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(items)))
+            f.write(array("Q", (key for key, _ in items)))
+            f.write(offsets)
+            f.write(blob)
+        os.replace(tmp_path, self.path)
+
+        self._added = {}
+        del self._table
+        logger.info("Path database written: %s (%d paths)", self.path, len(items))
+
+    def match(self, fs, paths):
+        # Keeps the candidates that exist in one of the indexes of fs
+        rv = 0
+        folders = {
+            folder.name(): folder for folder in fs.folders()
+        }
+        for path, dirname_hash, filename_hash in hash_paths(paths):
+            folder = folders.get(path.split("/", 1)[0])
+            if folder is not None and folder.has_file(dirname_hash, filename_hash):
+                if self.find(dirname_hash, filename_hash) is None:
+                    rv += 1
+                self.add(path, dirname_hash, filename_hash)
+        return rv
+
+    def __str__(self):
+        return "<pathdb.PathDatabase(path={self.path})>".format(self=self)
+
+################################################################################
+# candidates
+################################################################################
+
+def exd_candidates(dt):
+    for table in dt.tables():
+        for loc_table in table.loc_tables():
+            for row in loc_table.rows():
+                for value in row.values:
+                    if isinstance(value, ExdString):
+                        value = value.raw()
+                    if isinstance(value, bytes) and b"/" in value and b"." in value:
+                        yield str(value, "ascii", "ignore")
+
+MATERIAL_VARIANTS = range(1, 11)
+def material_candidates(model_path, material_name):
+    # Models only store absolute names for shared materials, the others are
+    # relative to the material folder next to the model folder
+    if not material_name.startswith("/"):
+        yield material_name
+        return
+    base_path = model_path.rsplit("/model/", 1)[0]
+    for variant in MATERIAL_VARIANTS:
+        yield "{0}/material/v{1:04}{2}".format(base_path, variant, material_name)
+
+def model_candidates(rsc, model_paths):
+    for model_path in model_paths:
+        try:
+            model = rsc.get_model(model_path)
+            material_names = set(mesh.material() for lod in model.lods() for mesh in lod.meshes())
+        except Exception as e:
+            logger.warning("Could not read model %s: %s", model_path, e)
+            continue
+        for material_name in material_names:
+            yield from material_candidates(model_path, material_name)
+
+def texture_candidates(rsc, material_paths):
+    for material_path in material_paths:
+        try:
+            yield from rsc.get_material(material_path).texture_names()
+        except Exception as e:
+            logger.warning("Could not read material %s: %s", material_path, e)
+
+def discover(db, fs, rsc, paths=(), dt=None):
+    # Matches the given paths and exd strings, then follows what they point to:
+    # models give material names, materials give texture names
+    rv = db.match(fs, paths)
+    if dt is not None:
+        rv += db.match(fs, exd_candidates(dt))
+    known_paths = [path for _, path in db.items()]
+    rv += db.match(fs, model_candidates(rsc, [path for path in known_paths if path.endswith(".mdl")]))
+    known_paths = [path for _, path in db.items()]
+    rv += db.match(fs, texture_candidates(rsc, [path for path in known_paths if path.endswith(".mtrl")]))
+    return rv
@@ -1,5 +1,7 @@
 from zlib import crc32
 
+from .utils import lazy_attribute
+
 class ResourceId:
     def __init__(self, folder_name, dirname_hash, filename_hash, path=None):
         self.folder_name = folder_name
@@ -10,6 +12,24 @@ class ResourceId:
     def __str__(self):
         return "<ResourceId(folder_name={self.folder_name}, dirname_hash={self.dirname_hash:08X}, filename_hash={self.filename_hash:08X}, path={self.path})>".format(self=self)
 
+class PathResourceId(ResourceId):
+    # Built from a full path, the hashes of its dirname and filename are only
+    # computed if something asks for them
+    def __init__(self, folder_name, path):
+        self.folder_name = folder_name
+        self.path = path
+
+    @lazy_attribute
+    def dirname_hash(self):
+        return path_hash(self.path.lower().rsplit("/", 1)[0])
+
+    @lazy_attribute
+    def filename_hash(self):
+        return path_hash(self.path.lower().rsplit("/", 1)[1])
+
+def path_hash(value):
+    return crc32(bytes(value, "ascii")) ^ 0xFFFFFFFF
+
 def resource_id_from_filepath(filepath):
     filepath_lower = filepath.lower()
 
@@ -18,8 +38,8 @@ def resource_id_from_filepath(filepath):
 
     return ResourceId(
         folder_name = folder_name,
-        dirname_hash = crc32(bytes(dirname, "ascii")) ^ 0xFFFFFFFF,
-        filename_hash = crc32(bytes(filename, "ascii")) ^ 0xFFFFFFFF,
+        dirname_hash = path_hash(dirname),
+        filename_hash = path_hash(filename),
         path = filepath
     )
 
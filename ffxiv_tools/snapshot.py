@@ -0,0 +1,112 @@
+from array import array
+from hashlib import sha1
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are raw dumps of native arrays, they are memory-mapped back as is
+# so they are only valid for the byte order they were written with
+MAGIC = b"FXSN" if sys.byteorder == "little" else b"NSXF"
+VERSION = 2
+
+HEADER = struct.Struct("<4sIQQII")
+COLUMN = struct.Struct("<16scxxxIQ")
+ALIGNMENT = 0x10
+COLUMN_NAME_SIZE = 0x10
+
+def typecode(values):
+    # Columns are either fresh arrays or memoryviews over a previous snapshot
+    return values.typecode if isinstance(values, array) else values.format
+
+class SnapshotStore:
+    def __init__(self, path):
+        self.path = path
+        logger.info("%s", self)
+
+    def snapshot_path(self, source_path):
+        source_path = os.path.abspath(source_path)
+        return os.path.join(
+            self.path,
+            "{0}_{1}.snap".format(os.path.basename(source_path), sha1(bytes(source_path, "utf-8")).hexdigest()[:16])
+        )
+
+    def load(self, source_path):
+        snapshot_path = self.snapshot_path(source_path)
+        if not os.path.exists(snapshot_path):
+            return None
+
+        source_stat = os.stat(source_path)
+        with open(snapshot_path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+
+        rv = {}
+        view = None
+        try:
+            magic, version, size, mtime_ns, path_size, column_count = HEADER.unpack_from(m, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("unknown snapshot format")
+            if size != source_stat.st_size or mtime_ns != source_stat.st_mtime_ns:
+                logger.info("Snapshot is stale: %s", snapshot_path)
+                m.close()
+                return None
+
+            view = memoryview(m)
+            pos = HEADER.size + path_size
+            for _ in range(column_count):
+                name, typecode, count, offset = COLUMN.unpack_from(m, pos)
+                pos += COLUMN.size
+                itemsize = array(typecode.decode("ascii")).itemsize
+                if offset + count * itemsize > len(m):
+                    raise ValueError("column past the end of the file")
+                rv[name.rstrip(b"\x00").decode("ascii")] = view[offset:offset + count * itemsize].cast(typecode.decode("ascii"))
+            # Every column has one value per index entry
+            if len(set(map(len, rv.values()))) > 1:
+                raise ValueError("columns of different lengths")
+            return rv
+        except (ValueError, TypeError, struct.error) as e:
+            logger.warning("Ignoring unreadable snapshot %s: %s", snapshot_path, e)
+            # The mapping cannot be closed while views over it are alive
+            for values in rv.values():
+                values.release()
+            if view is not None:
+                view.release()
+            m.close()
+            return None
+
+    def save(self, source_path, columns):
+        snapshot_path = self.snapshot_path(source_path)
+        source_stat = os.stat(source_path)
+        encoded_path = bytes(os.path.abspath(source_path), "utf-8")
+
+        offset = HEADER.size + len(encoded_path) + COLUMN.size * len(columns)
+        column_headers = []
+        for name, values in columns.items():
+            if len(name) > COLUMN_NAME_SIZE:
+                raise ValueError("Column name too long: {}".format(name))
+            offset += -offset % ALIGNMENT
+            column_headers.append(COLUMN.pack(bytes(name, "ascii"), bytes(typecode(values), "ascii"), len(values), offset))
+            offset += len(values) * values.itemsize
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        # Written aside then renamed so that a concurrent run never maps a partial file
+        tmp_path = "{0}.{1}.{2}.tmp".format(snapshot_path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, source_stat.st_size, source_stat.st_mtime_ns, len(encoded_path), len(columns)))
+            f.write(encoded_path)
+            for column_header in column_headers:
+                f.write(column_header)
+            for values in columns.values():
+                f.write(b"\x00" * (-f.tell() % ALIGNMENT))
+                f.write(values)
+        os.replace(tmp_path, snapshot_path)
+        logger.info("Snapshot written: %s", snapshot_path)
+
+    def __str__(self):
+        return "<snapshot.SnapshotStore(path={self.path})>".format(self=self)
@@ -0,0 +1,81 @@
+from collections import defaultdict
+import threading
+from time import perf_counter
+
+# Process wide counters and stage timings. They are off by default and every
+# hook starts by checking ENABLED, so that a disabled run only pays for that
+# test. Hot paths test stats.ENABLED themselves before calling in.
+#
+# Worker processes (extract, verify) count on their own, they send what they
+# counted back with each result to be merged into the parent counters.
+
+ENABLED = False
+
+_counters = defaultdict(int)
+_times = defaultdict(float)
+_lock = threading.Lock()
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _times.clear()
+
+def add(name, value=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] += value
+
+def add_time(name, seconds):
+    if ENABLED:
+        with _lock:
+            _times[name] += seconds
+
+class timed:
+    # with stats.timed("fsdt.exd_parse"): ...
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            add_time(self.name, perf_counter() - self.start)
+
+def snapshot(reset=False):
+    # reset starts counting from zero again, for the workers to only send
+    # what they counted since their previous result
+    with _lock:
+        rv = {
+            "counters": dict(_counters),
+            "times": dict(_times)
+        }
+        if reset:
+            _counters.clear()
+            _times.clear()
+        return rv
+
+def merge(values):
+    # Adds a snapshot taken in another process
+    if ENABLED and values:
+        with _lock:
+            for name, value in values["counters"].items():
+                _counters[name] += value
+            for name, value in values["times"].items():
+                _times[name] += value
+
+def rows():
+    # (name, value) sorted by name, times in seconds
+    values = snapshot()
+    rv = [(name, value) for name, value in values["counters"].items()]
+    rv += [(name + ".seconds", "{:.4f}".format(value)) for name, value in values["times"].items()]
+    return sorted(rv)
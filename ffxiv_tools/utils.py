@@ -1,7 +1,11 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, wait
 from contextlib import contextmanager
 from itertools import chain, islice
 import mmap
+import threading
+
+from . import stats
 
 class lazy_attribute:
     def __init__(self, fget):
@@ -19,8 +23,130 @@ class lazy_attribute:
 def mmap_reader(filepath):
     with open(filepath, "rb") as f:
         with mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) as m:
+            stats.add("mmap.maps")
+            stats.add("mmap.bytes_mapped", len(m))
             yield m
 
+def close_mmap(m):
+    try:
+        m.close()
+    except BufferError:
+        # Still exported through a memoryview, it gets unmapped once the last view is gone
+        pass
+
+class MmapPool:
+    class Entry:
+        def __init__(self, m):
+            self.m = m
+            self.users = 0
+            self.evicted = False
+
+    def __init__(self, max_open=16):
+        # A mapping is only handed out while it is open, at least one is kept
+        if max_open < 1:
+            raise ValueError("At least one mmap must be kept open, not {}".format(max_open))
+        self.max_open = max_open
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, filepath):
+        entry = self._entries.pop(filepath)
+        entry.evicted = True
+        if entry.users == 0:
+            close_mmap(entry.m)
+
+    @contextmanager
+    def reader(self, filepath):
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is None:
+                with open(filepath, "rb") as f:
+                    entry = self.Entry(mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ))
+                stats.add("mmap.maps")
+                stats.add("mmap.bytes_mapped", len(entry.m))
+                self._entries[filepath] = entry
+                while len(self._entries) > self.max_open:
+                    self._evict(next(iter(self._entries)))
+            else:
+                self._entries.move_to_end(filepath)
+            entry.users += 1
+        try:
+            yield entry.m
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.evicted and entry.users == 0:
+                    close_mmap(entry.m)
+
+    def close(self):
+        with self._lock:
+            for filepath in list(self._entries):
+                self._evict(filepath)
+
+class ByteLRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return "<utils.ByteLRUCache(max_bytes={self.max_bytes}, size={self.size}, entries={0}, hits={self.hits}, misses={self.misses})>".format(len(self._entries), self=self)
+
+SIZE_SUFFIXES = {
+    "K": 1 << 10,
+    "M": 1 << 20,
+    "G": 1 << 30
+}
+def parse_size(value):
+    value = value.strip().upper()
+    if value and value[-1] in SIZE_SUFFIXES:
+        return int(value[:-1]) * SIZE_SUFFIXES[value[-1]]
+    return int(value)
+
+def bounded_map(executor, func, items, max_in_flight):
+    # Like executor.map, in completion order, but only max_in_flight items
+    # are submitted at once so results never pile up
+    items = iter(items)
+    pending = set(executor.submit(func, item) for item in islice(items, max_in_flight))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+        pending.update(executor.submit(func, item) for item in islice(items, len(done)))
+
 NAMEDTUPLE_CACHE = {}
 def nt(name, *args):
     if not name in NAMEDTUPLE_CACHE:
@@ -0,0 +1,76 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+from . import stats
+from .extract import output_path
+from .utils import MmapPool, bounded_map
+from .fmt.dat import check_file
+
+logger = logging.getLogger(__name__)
+
+################################################################################
+# workers
+################################################################################
+
+# Workers only read dats, each one keeps its own pool of mmaps
+WORKER_MMAPS = None
+
+def init_worker(max_open_dats, stats_enabled):
+    global WORKER_MMAPS
+    WORKER_MMAPS = MmapPool(max_open_dats)
+    stats.enable(stats_enabled)
+
+def verify_chunk(jobs):
+    # (bytes read, corrupt entries, stats of the chunk)
+    size = 0
+    corrupt = []
+    for dat_path, offset, end, names in jobs:
+        try:
+            with WORKER_MMAPS.reader(dat_path) as m:
+                read_size, errors = check_file(m, offset, end)
+        except OSError as e:
+            read_size, errors = 0, [str(e)]
+        size += read_size
+        if errors:
+            corrupt.append((dat_path, offset, names, errors))
+    return size, corrupt, stats.snapshot(reset=True) if stats.ENABLED else None
+
+################################################################################
+# verification
+################################################################################
+
+def verify_jobs(file_refs):
+    # One job per stored entry, in dat and offset order so that every dat is
+    # read as one sequential scan. An entry ends where the next one starts.
+    entries = {}
+    for file_ref in file_refs:
+        entries.setdefault((file_ref.dat_path, file_ref.offset), []).append(output_path(file_ref.resource_id()))
+
+    jobs = []
+    keys = sorted(entries)
+    for i, (dat_path, offset) in enumerate(keys):
+        end = keys[i + 1][1] if i + 1 < len(keys) and keys[i + 1][0] == dat_path else None
+        jobs.append((dat_path, offset, end, entries[(dat_path, offset)]))
+    return jobs
+
+def verify(file_system, file_refs, workers=None, chunk_size=256, max_in_flight=None):
+    # Returns (entry count, bytes read, corrupt entries), a corrupt entry
+    # being (dat path, offset, file names, errors)
+    jobs = verify_jobs(file_refs)
+
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 2
+    chunks = (jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size))
+
+    size = 0
+    corrupt = []
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(file_system.mmaps.max_open, stats.ENABLED)) as executor:
+        for read_size, chunk_corrupt, chunk_stats in bounded_map(executor, verify_chunk, chunks, max_in_flight):
+            size += read_size
+            corrupt.extend(chunk_corrupt)
+            stats.merge(chunk_stats)
+
+    corrupt.sort(key=lambda entry: entry[:2])
+    logger.info("Verified %d entries (%d bytes), %d corrupt", len(jobs), size, len(corrupt))
+    return len(jobs), size, corrupt
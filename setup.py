@@ -16,5 +16,8 @@ setup(
         'binr',
         'bottle'
     ],
+    extras_require={
+        'numpy': ['numpy']
+    },
     zip_safe=False
 )